@@ -0,0 +1,319 @@
+import argparse
+import gc
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from command_formats import write_commands
+from palette_core import PaletteCore
+from scorers import SCORERS, make_scorer
+from thefuzz import utils
+
+# Benchmark suite over synthetic catalogs. Each size runs in its own process so the memory
+# figures are that size's alone; the parent collects the results into one JSON document:
+#
+#   python benchmark.py --sizes 1000,10000,100000,1000000 --output before.json
+#   python benchmark.py --output after.json --compare before.json
+#
+# Rendering needs a display; run under `xvfb-run python benchmark.py --render ...`.
+# --scorers also times each fuzzy scorer backend on its own over the catalog's names, and
+# --refine the search index with and without refinement of the previous keystroke's pass.
+DEFAULT_SIZES = [1000, 10000, 100000, 1000000]
+SEED = 0
+TRACES = ["youtube music", "github deploy", "open settings", "shutdown pc", "weathr today", "spotify jazz playlist"]
+
+VERBS = ["Open", "Search", "Launch", "Deploy", "Restart", "Stop", "Show", "Play", "Build", "Sync", "Backup", "Toggle"]
+SUBJECTS = ["YouTube", "GitHub", "Spotify", "Gmail", "Calendar", "Notes", "Terminal", "Settings", "Docker", "Drive",
+            "Weather", "Slack", "Jira", "Figma", "VPN", "Bluetooth", "Wi-Fi", "Photos", "Music", "Downloads"]
+QUALIFIERS = ["", "", "", "staging", "production", "today", "playlist", "jazz", "work", "home", "PR", "issues", "tab"]
+DESCRIPTIONS = ["Opens {s} in the browser", "Runs the {s} task for {q}", "Shows {s} {q}", "Starts {s} in the background",
+                "Quick access to {s}", "Searches {s} for {q}"]
+ACTIONS = [("WEB", "https://example.com/{s}/{{query}}"), ("SYSTEM", "echo {s} {q}"), ("OPEN", "/usr/bin/{s}")]
+
+
+def synthetic_catalog(size, seed=SEED):
+    # Names like "Deploy Docker staging 4812": a few hundred distinct phrases, numbered so
+    # every name is unique, the way large generated libraries tend to look
+    rng = random.Random(seed)
+    catalog = []
+    for i in range(size):
+        subject = rng.choice(SUBJECTS)
+        qualifier = rng.choice(QUALIFIERS)
+        name = " ".join(part for part in (rng.choice(VERBS), subject, qualifier) if part) + f" {i}"
+        description = rng.choice(DESCRIPTIONS).format(s=subject, q=qualifier or "everything")
+        action, target = rng.choice(ACTIONS)
+        catalog.append((name, description, action, target.format(s=subject.lower(), q=qualifier)))
+    return catalog
+
+
+def percentile(timings, fraction):
+    ordered = sorted(timings)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+def summary(timings):
+    return {
+        "count": len(timings),
+        "p50_ms": percentile(timings, 0.50),
+        "p99_ms": percentile(timings, 0.99),
+        "max_ms": max(timings),
+        "total_ms": sum(timings),
+    }
+
+
+def rss_mb():
+    # Current resident set size where /proc has it, else the peak so far
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError, IndexError):
+        return peak_rss_mb()
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, (time.perf_counter() - start) * 1000
+
+
+def keystrokes():
+    return [trace[:end] for trace in TRACES for end in range(1, len(trace) + 1)]
+
+
+def bench_size(size, workdir, render=False, scorers=False, refine=False):
+    result = {"size": size}
+    catalog = synthetic_catalog(size)
+    store_path = os.path.join(workdir, f"catalog-{size}.json")
+    with open(store_path, "w") as f:
+        json.dump({"sequence": 0, "commands": catalog}, f)
+    history_path = os.path.join(workdir, f"history-{size}.json")
+    gc.collect()
+    baseline_mb = rss_mb()
+
+    # Load: store snapshot read plus search index build, as the catalog loader does it
+    core = PaletteCore([], commands_file=store_path, history_file=history_path)
+    core.load_history()
+    start = time.perf_counter()
+    core.start_loading()
+    core.catalog_loader.index_ready.wait()
+    index_ready = time.perf_counter()
+    core.wait_for_catalog()
+    loaded = time.perf_counter()
+    result["load"] = {
+        "index_ready_ms": (index_ready - start) * 1000,
+        "catalog_loaded_ms": (loaded - start) * 1000,
+        "commands": len(core.commands),
+    }
+    gc.collect()
+    result["memory"] = {"catalog_and_index_mb": rss_mb() - baseline_mb}
+
+    # Per-keystroke search: every prefix of the typing traces, cold, then the same traces
+    # again so the query cache is exercised too
+    index = core.search_index
+    result["scorer"] = index.scorer.name
+    cold = [timed(core.search, query)[1] for query in keystrokes()]
+    warm = [timed(core.search, query)[1] for query in keystrokes()]
+    result["search"] = {"cold": summary(cold), "warm": summary(warm), "cache": index.cache.stats()}
+
+    if render:
+        result["render"] = bench_render(core)
+    if scorers:
+        result["scorers"] = bench_scorers(catalog)
+    if refine:
+        result["refine"] = bench_refine(catalog)
+
+    # Import: the same catalog under new names into an empty store, streamed from disk in
+    # two formats; apply_import is the single batched store write plus index update
+    imported = [(f"imported {cmd[0]}",) + cmd[1:] for cmd in catalog]
+    result["import"] = {}
+    for extension in ("json", "pcmd"):
+        import_path = os.path.join(workdir, f"import-{size}.{extension}")
+        write_commands(import_path, imported)
+        target = PaletteCore([], commands_file=os.path.join(workdir, f"target-{size}-{extension}.json"), history_file=history_path)
+        target.load_history()
+        target.wait_for_catalog()
+        command_import, parse_ms = timed(target.start_import, import_path, "skip", False)
+        _, apply_ms = timed(target.apply_import, command_import)
+        result["import"][extension] = {
+            "file_mb": os.path.getsize(import_path) / 2**20,
+            "parse_ms": parse_ms,
+            "apply_ms": apply_ms,
+            "commands_per_second": len(command_import.added) / ((parse_ms + apply_ms) / 1000),
+        }
+        target.close()
+    core.close()
+    result["memory"]["peak_rss_mb"] = peak_rss_mb()
+    return result
+
+
+def bench_render(core):
+    # Rendering the result list for each keystroke's results and for the full empty-query
+    # listing, flushed with update_idletasks so the Tk work is counted
+    try:
+        import customtkinter
+        from command_palette import ResultItems, VirtualResultList
+        root = customtkinter.CTk()
+    except Exception as e:
+        return {"skipped": f"no display or GUI dependencies: {e}"}
+    root.geometry("600x400")
+    root.rowconfigure(0, weight=1)
+    root.columnconfigure(0, weight=1)
+    result_list = VirtualResultList(
+        root,
+        label_text="benchmark",
+        label_font=customtkinter.CTkFont(size=10, weight="bold"),
+        on_click=lambda *args: None,
+        on_shift_click=lambda *args: None,
+        on_context=lambda *args: None,
+        on_scroll=lambda: None,
+    )
+    result_list.grid(row=0, column=0, sticky="nsew")
+    root.update()
+
+    timings = []
+    for query in keystrokes():
+        results = core.search(query)
+        items = [("header", "ALL AVAILABLE COMMANDS ", "all_header")] + [("command", cmd, False) for cmd in results]
+        start = time.perf_counter()
+        result_list.set_items(items)
+        root.update_idletasks()
+        timings.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    result_list.set_items(ResultItems([("header", "ALL AVAILABLE COMMANDS ", "all_header")], core.commands))
+    root.update_idletasks()
+    listing_ms = (time.perf_counter() - start) * 1000
+    root.destroy()
+    return {"keystrokes": summary(timings), "full_listing_ms": listing_ms}
+
+
+def bench_scorers(catalog):
+    # One whole-catalog extract per typing trace, per backend; thefuzz is slow on the
+    # largest sizes, which is why this is opt-in
+    choices = {i: utils.full_process(command[0]) for i, command in enumerate(catalog)}
+    result = {}
+    for name in SCORERS:
+        scorer = make_scorer(name)
+        try:
+            result[name] = summary([timed(scorer.extract, utils.full_process(trace), choices, 12)[1] for trace in TRACES])
+        except Exception as e:
+            result[name] = {"skipped": str(e)}
+    return result
+
+
+def bench_refine(catalog):
+    # Every keystroke of the typing traces against a bare SearchIndex with its query cache
+    # off, so each one is a real pass, once without and once with refinement
+    from search_index import SearchIndex
+    result = {}
+    for refine in (False, True):
+        index = SearchIndex(catalog, refine=refine)
+        index.cache.capacity = 0
+        result["refined" if refine else "unrefined"] = summary([timed(index.search, query, 60)[1] for query in keystrokes()])
+    return result
+
+
+def revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def run_child(size, render, scorers, refine):
+    # One size in a fresh interpreter; its result comes back as JSON on stdout
+    command = [sys.executable, os.path.abspath(__file__), "--child", str(size)]
+    if render:
+        command.append("--render")
+    if scorers:
+        command.append("--scorers")
+    if refine:
+        command.append("--refine")
+    completed = subprocess.run(command, capture_output=True, text=True)
+    if completed.returncode != 0:
+        return {"size": size, "error": completed.stderr.strip().splitlines()[-1:] or ["failed"]}
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def metrics(result, prefix=""):
+    # Flattens a size's result into "search.cold.p50_ms"-style keys for comparison
+    flat = {}
+    for key, value in result.items():
+        if isinstance(value, dict):
+            flat.update(metrics(value, f"{prefix}{key}."))
+        elif isinstance(value, (int, float)) and key != "size":
+            flat[f"{prefix}{key}"] = value
+    return flat
+
+
+def compare(baseline, current):
+    for size, result in current["sizes"].items():
+        before = baseline.get("sizes", {}).get(size)
+        if before is None:
+            continue
+        print(f"{size} commands ({baseline.get('revision')} -> {current.get('revision')}):")
+        old, new = metrics(before), metrics(result)
+        for key in sorted(new):
+            if key in old and old[key] and key.endswith(("_ms", "_mb", "per_second")):
+                print(f"  {key:<40}{old[key]:12.2f}{new[key]:12.2f}{(new[key] / old[key] - 1) * 100:+9.1f}%")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Command palette benchmark suite")
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)), help="comma separated catalog sizes")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="print the change against an earlier results file")
+    parser.add_argument("--render", action="store_true", help="also time rendering (needs a display, e.g. xvfb-run)")
+    parser.add_argument("--scorers", action="store_true", help="also time each scorer backend on its own")
+    parser.add_argument("--refine", action="store_true", help="also time the search index with and without refinement")
+    parser.add_argument("--child", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child is not None:
+        with tempfile.TemporaryDirectory() as workdir:
+            print(json.dumps(bench_size(args.child, workdir, args.render, args.scorers, args.refine)))
+        return 0
+
+    results = {
+        "revision": revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "started": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "sizes": {},
+    }
+    for size in (int(size) for size in args.sizes.split(",")):
+        print(f"Benchmarking {size} commands...", file=sys.stderr)
+        result = run_child(size, args.render, args.scorers, args.refine)
+        results["sizes"][str(size)] = result
+        if "error" in result:
+            print(f"  failed: {result['error']}", file=sys.stderr)
+            continue
+        print(f"  load {result['load']['catalog_loaded_ms']:.0f} ms, search p50 {result['search']['cold']['p50_ms']:.1f} ms "
+              f"p99 {result['search']['cold']['p99_ms']:.1f} ms, import {result['import']['pcmd']['commands_per_second']:.0f}/s, "
+              f"{result['memory']['catalog_and_index_mb']:.0f} MB", file=sys.stderr)
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), results)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
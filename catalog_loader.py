@@ -0,0 +1,54 @@
+import queue
+import threading
+
+
+class CatalogLoader:
+    # Builds the search index and loads the custom commands on a worker thread, so the
+    # window is up and typing before a large library has been read. The built-ins are
+    # indexed first and `index_ready` is set, after which searches can run; the store's
+    # commands then go into the index BATCH_SIZE at a time, and each batch is queued for
+    # the Tk thread, which polls `batches` with after() and ends at the None sentinel.
+    # A SQLite store loads as one lazy view, so it arrives as a single batch.
+    BATCH_SIZE = 2000
+
+    def __init__(self, store, make_index, builtins, on_index_ready=None):
+        self.store = store
+        self.make_index = make_index
+        self.builtins = builtins
+        self.on_index_ready = on_index_ready
+        self.index = None
+        self.index_ready = threading.Event()
+        self.batches = queue.Queue()
+        self.loaded = 0
+        self.total = None
+        self.thread = threading.Thread(target=self.run, name="catalog-loader", daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def run(self):
+        try:
+            self.index = self.make_index()
+            self.index.add_many(self.builtins)
+        finally:
+            self.index_ready.set()
+        if self.on_index_ready is not None:
+            self.on_index_ready()
+
+        try:
+            commands = self.store.load()
+        except (OSError, ValueError):
+            print("Error opening custom commands file")
+            commands = []
+        if self.store.lazy:
+            self.total = self.loaded = len(commands)
+            self.batches.put(commands)
+        else:
+            self.total = len(commands)
+            for start in range(0, len(commands), self.BATCH_SIZE):
+                batch = commands[start:start + self.BATCH_SIZE]
+                self.index.add_many(batch)
+                self.loaded += len(batch)
+                self.batches.put(batch)
+        self.batches.put(None)
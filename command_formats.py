@@ -0,0 +1,188 @@
+import gzip
+import io
+import json
+import struct
+from itertools import accumulate, islice
+from json.encoder import encode_basestring
+
+CHUNK_SIZE = 1 << 16
+WRITE_BATCH = 1024
+GZIP_MAGIC = b"\x1f\x8b"
+# Binary snapshot: the magic, then blocks of up to WRITE_BATCH commands. A block is its
+# command count and text size, the character lengths of the name, description, action and
+# target of each command (little-endian uint32), and all those fields as one UTF-8 text.
+BINARY_MAGIC = b"PCMD\x01"
+BLOCK_HEADER = struct.Struct("<2I")
+
+FILE_TYPES = [
+    ("JSON Files", "*.json"),
+    ("NDJSON Files", "*.ndjson *.jsonl"),
+    ("Compressed Files", "*.json.gz *.ndjson.gz *.pcmd.gz"),
+    ("Binary Snapshots", "*.pcmd"),
+    ("All Files", "*.*"),
+]
+
+
+def iter_json_array(f, chunk_size=CHUNK_SIZE):
+    # Yields the elements of a top-level JSON array one at a time, reading `chunk_size`
+    # characters at a time, so a large file never has to be parsed in one piece.
+    decoder = json.JSONDecoder()
+    buffer, position, eof = "", 0, False
+
+    def fill():
+        nonlocal buffer, position, eof
+        chunk = f.read(chunk_size)
+        eof = not chunk
+        buffer = buffer[position:] + chunk
+        position = 0
+
+    def skip(characters):
+        nonlocal position
+        while True:
+            while position < len(buffer) and buffer[position] in characters:
+                position += 1
+            if position < len(buffer) or eof:
+                return
+            fill()
+
+    fill()
+    skip(" \t\r\n")
+    if buffer[position:position + 1] != "[":
+        raise ValueError("File data does not seem to be in a list form")
+    position += 1
+    while True:
+        skip(" \t\r\n,")
+        if position >= len(buffer):
+            raise ValueError("Unexpected end of file")
+        if buffer[position] == "]":
+            return
+        try:
+            element, end = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            end = None
+        # A value running into the end of the buffer may continue in the next chunk
+        if end is None or (end == len(buffer) and not eof):
+            if eof:
+                raise ValueError("Malformed JSON in import file")
+            fill()
+            continue
+        position = end
+        yield element
+
+
+def iter_ndjson(f):
+    # Lines are parsed a batch at a time as one array; a batch with a malformed line is
+    # redone line by line, and the bad line comes through as None for the importer to skip
+    while True:
+        batch = list(islice(f, WRITE_BATCH))
+        if not batch:
+            return
+        lines = [line for line in batch if line.strip()]
+        if not lines:
+            continue
+        try:
+            records = json.loads("[" + ",".join(lines) + "]")
+        except json.JSONDecodeError:
+            records = []
+            for line in lines:
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    records.append(None)
+        yield from records
+
+
+def iter_binary(f):
+    if f.read(len(BINARY_MAGIC)) != BINARY_MAGIC:
+        raise ValueError("Not a command snapshot")
+    while True:
+        header = f.read(BLOCK_HEADER.size)
+        if not header:
+            return
+        if len(header) < BLOCK_HEADER.size:
+            raise ValueError("Truncated command snapshot")
+        count, text_size = BLOCK_HEADER.unpack(header)
+        lengths = f.read(4 * 4 * count)
+        text = f.read(text_size)
+        if len(lengths) < 4 * 4 * count or len(text) < text_size:
+            raise ValueError("Truncated command snapshot")
+        # One decode per block; the fields are then cut out by their character lengths
+        text = text.decode("utf-8")
+        offsets = list(accumulate(struct.unpack(f"<{4 * count}I", lengths), initial=0))
+        fields = [text[start:end] for start, end in zip(offsets, offsets[1:])]
+        yield from map(list, zip(*[iter(fields)] * 4))
+
+
+def read_commands(raw):
+    # Detects the format from the first bytes of the file rather than its name: gzip,
+    # then the binary snapshot magic, then a JSON array versus one command per line. An
+    # array of commands opens with "[[" or "[]" give or take whitespace, an NDJSON line
+    # with '["'. `raw` is a binary file; its tell() stays a valid progress measure.
+    stream = raw
+    if raw.peek(len(GZIP_MAGIC))[:len(GZIP_MAGIC)] == GZIP_MAGIC:
+        stream = io.BufferedReader(gzip.GzipFile(fileobj=raw, mode="rb"), CHUNK_SIZE)
+    head = stream.peek(len(BINARY_MAGIC))
+    if head[:len(BINARY_MAGIC)] == BINARY_MAGIC:
+        return iter_binary(stream)
+    text = io.TextIOWrapper(stream, encoding="utf-8-sig")
+    start = head.lstrip(b"\xef\xbb\xbf \t\r\n")
+    if start[:1] == b"[" and start[1:].lstrip(b" \t\r\n")[:1] in (b"[", b"]", b""):
+        return iter_json_array(text)
+    return iter_ndjson(text)
+
+
+def encode_record(cmd):
+    # Same text as json.dumps(list(cmd[:4]), ensure_ascii=False), several times faster
+    return "[" + ", ".join(map(encode_basestring, cmd[:4])) + "]"
+
+
+def export_format(path):
+    name = path.lower()
+    compressed = name.endswith(".gz")
+    if compressed:
+        name = name[:-3]
+    if name.endswith(".pcmd"):
+        return "binary", compressed
+    if name.endswith((".ndjson", ".jsonl")):
+        return "ndjson", compressed
+    return "json", compressed
+
+
+def write_commands(path, commands):
+    # Streams `commands` (any iterable, e.g. a CommandPages view) to `path` in the format
+    # its extension names, a batch of records per write. Returns the number written.
+    kind, compressed = export_format(path)
+    commands = iter(commands)
+    count = 0
+    with (gzip.open(path, "wb", compresslevel=6) if compressed else open(path, "wb")) as f:
+        if kind == "binary":
+            f.write(BINARY_MAGIC)
+            for batch in iter(lambda: list(islice(commands, WRITE_BATCH)), []):
+                fields = [field for cmd in batch for field in cmd[:4]]
+                text = "".join(fields).encode("utf-8")
+                f.write(BLOCK_HEADER.pack(len(batch), len(text)))
+                f.write(struct.pack(f"<{len(fields)}I", *map(len, fields)))
+                f.write(text)
+                count += len(batch)
+            return count
+
+        text = io.TextIOWrapper(f, encoding="utf-8", newline="\n")
+        if kind == "json":
+            text.write("[")
+        batch = []
+        for cmd in commands:
+            line = encode_record(cmd)
+            if kind == "json":
+                batch.append(("\n" if count == 0 else ",\n") + line)
+            else:
+                batch.append(line + "\n")
+            count += 1
+            if len(batch) >= WRITE_BATCH:
+                text.write("".join(batch))
+                batch = []
+        text.write("".join(batch))
+        if kind == "json":
+            text.write("\n]\n")
+        # Hand the file back to the with block instead of letting the wrapper close it
+        text.detach()
+    return count
@@ -0,0 +1,97 @@
+import os
+import threading
+from command_formats import read_commands
+from command_record import Command
+from target_template import TargetTemplate
+
+POLICIES = ("skip", "overwrite", "rename")
+
+
+class CommandImport:
+    # Reads an import file in any format command_formats.py detects on a worker thread.
+    # Names are checked against sets, so the cost is linear in the file no matter how large
+    # the catalog is. Conflicts with existing custom commands follow `policy`: "skip" keeps
+    # the existing command, "overwrite" replaces it, "rename" adds the import as
+    # "name (2)", "name (3)", ... Built-in commands are never overwritten, and commands
+    # with malformed targets (see target_template.py) are skipped as invalid. The Tk side
+    # polls the progress attributes and applies the result in one go once `state` leaves
+    # "running".
+    def __init__(self, path, names, builtin_names, find_existing, policy="skip"):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown import policy: {policy}")
+        self.path = path
+        self.names = set(names)
+        self.builtin_names = builtin_names
+        self.find_existing = find_existing
+        self.policy = policy
+        self.state = "running"
+        self.error = None
+        self.total_bytes = 0
+        self.bytes_read = 0
+        self.processed = 0
+        self.skipped = 0
+        self.renamed = 0
+        self.added = []
+        self.added_positions = {}
+        self.replaced = {}
+        self.thread = threading.Thread(target=self.run, name="command-import", daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def run(self):
+        try:
+            self.total_bytes = os.path.getsize(self.path)
+            with open(self.path, "rb") as f:
+                for cmd_data in read_commands(f):
+                    self.import_one(cmd_data)
+                    self.processed += 1
+                    if self.processed % 1000 == 0:
+                        self.bytes_read = f.tell()
+            self.bytes_read = self.total_bytes
+            self.state = "done"
+        except (OSError, EOFError, ValueError) as e:
+            self.error = e
+            self.state = "failed"
+
+    def import_one(self, cmd_data):
+        if not (isinstance(cmd_data, list) and len(cmd_data) in (4, 5) and all(isinstance(field, str) for field in cmd_data[:4])):
+            self.skipped += 1
+            return
+        name, description, action, target = cmd_data[:4]
+        if ("{" in target or "}" in target) and not TargetTemplate(target).valid:
+            self.skipped += 1
+            return
+        if name in self.names:
+            if self.policy == "rename":
+                name = self.free_name(name)
+                self.renamed += 1
+            elif self.policy == "overwrite" and name not in self.builtin_names:
+                # A name repeated within the file: the last entry wins. An overwritten
+                # command keeps the id of the one it replaces
+                if name in self.added_positions:
+                    position = self.added_positions[name]
+                    self.added[position] = Command(name, description, action, target, command_id=self.added[position].id)
+                    return
+                existing = self.replaced[name][0] if name in self.replaced else self.find_existing(name)
+                command_id = None if existing is None else existing.id
+                self.replaced[name] = (existing, Command(name, description, action, target, command_id=command_id))
+                return
+            else:
+                self.skipped += 1
+                return
+        self.names.add(name)
+        self.added_positions[name] = len(self.added)
+        self.added.append(Command(name, description, action, target))
+
+    def free_name(self, name):
+        copy = 2
+        while f"{name} ({copy})" in self.names:
+            copy += 1
+        return f"{name} ({copy})"
+
+    def progress(self):
+        if not self.total_bytes:
+            return 0.0
+        return min(self.bytes_read / self.total_bytes, 1.0)
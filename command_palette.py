@@ -1,13 +1,25 @@
+import sys
+from startup_profile import StartupProfile
+startup_profile = StartupProfile(enabled="--profile-startup" in sys.argv)
 import customtkinter
 import tkinter as tk
 from tkinter import filedialog
 import commands
-import webbrowser
-import subprocess
-import json
-import os
-import re
-from thefuzz import process, fuzz
+import time
+import bisect
+from collections.abc import Sequence
+from search_scheduler import SearchScheduler
+from command_formats import FILE_TYPES
+from command_record import Command
+from target_template import TargetTemplate
+from command_store import ChainedCommands
+from palette_core import PaletteCore
+from latency_profile import LatencyProfile
+latency_profile = LatencyProfile(enabled="--profile-latency" in sys.argv or "--latency-overlay" in sys.argv)
+
+# search_index (thefuzz, rapidfuzz, numpy) and webbrowser are imported where they are
+# first used; neither is needed to show the window
+startup_profile.mark("imports")
 
 customtkinter.set_appearance_mode("Dark")
 customtkinter.set_default_color_theme("blue")
@@ -90,13 +102,442 @@ class ConfirmationWindow(customtkinter.CTkToplevel):
         callback()
         self.destroy()
 
+class ResultStyle:
+    # Fonts and colors of the result rows, made once and shared by all of them. Colors are
+    # (light, dark) pairs, which CTk widgets switch between by themselves when the
+    # appearance mode changes, so a mode switch does not touch the rows at all. Colors that
+    # come from the color theme are read again by load_theme(), after which
+    # VirtualResultList.restyle() updates the pooled rows in place.
+    ROW_COLORS = {
+        False: (("#F2F2F2", "#2A2A2A"), ("#FAFAFA", "#252525")),
+        True: (("#DCDCDC", "#353535"), ("#D2D2D2", "#3A3A3A")),
+    }
+    NAME_COLORS = {False: ("black", "white"), True: ("#10B981", "#10B981")}
+    HEADER_COLOR = "#B0B0B0"
+    TEXT_COLOR = ("#000000", "#FFFFFF")
+
+    def __init__(self):
+        self.fonts = {
+            "name": customtkinter.CTkFont(size=13, weight="bold"),
+            "description": customtkinter.CTkFont(size=12),
+            "origin": customtkinter.CTkFont(size=10, family="Lexend", weight="bold"),
+            "action": customtkinter.CTkFont(family="Lexend", size=10),
+            "recent_header": customtkinter.CTkFont(size=14, weight="bold", slant="italic"),
+            "all_header": customtkinter.CTkFont(size=10, weight="bold", slant="italic"),
+        }
+        self.load_theme()
+
+    def load_theme(self):
+        theme = customtkinter.ThemeManager.theme
+        self.selection_color = theme["CTkButton"]["fg_color"]
+        self.label_color = theme["CTkScrollableFrame"]["label_fg_color"]
+
+    def row_color(self, is_history, index):
+        return self.ROW_COLORS[is_history][index % 2]
+
+
+class ResultRow(customtkinter.CTkFrame):
+    def __init__(self, master, style):
+        super().__init__(master, corner_radius=8, height=40)
+        self.style = style
+        self.fonts = style.fonts
+        self.item = None
+        self.item_index = -1
+        self.command_index = -1
+        self.is_selected = False
+        self.fg_color = None
+
+        self.grid_columnconfigure(1, weight=1)
+        self.grid_rowconfigure(0, weight=1)
+
+        self.name_label = customtkinter.CTkLabel(self, text="", font=self.fonts["name"], anchor="w")
+        self.name_label.grid(row=0, column=0, sticky="w", padx=(10, 0), pady=5)
+
+        self.description_label = customtkinter.CTkLabel(
+            self,
+            text="",
+            font=self.fonts["description"],
+            anchor="e",
+            text_color="#888888"
+        )
+        self.description_label.grid(row=0, column=1, sticky="ew", padx=10, pady=5)
+
+        self.origin_label = customtkinter.CTkLabel(
+            self,
+            text="CUSTOM",
+            font=self.fonts["origin"],
+            anchor="center",
+            text_color="#FACC15",
+            bg_color="#453A1B",
+            corner_radius=5,
+        )
+        self.origin_label.grid(row=0, column=2, sticky="e", padx=(0, 5), pady=5)
+
+        self.action_label = customtkinter.CTkLabel(
+            self,
+            text="",
+            font=self.fonts["action"],
+            anchor="e",
+            text_color="white",
+            bg_color="#666666",
+            corner_radius=5,
+        )
+        self.action_label.grid(row=0, column=3, sticky="e", padx=(0, 10), pady=5)
+
+    def widgets(self):
+        return (self, self.name_label, self.description_label, self.origin_label, self.action_label)
+
+    def show(self, item, item_index, command_index):
+        if self.item is item and self.item_index == item_index:
+            return
+        self.item = item
+        self.item_index = item_index
+        self.command_index = command_index
+        if item[0] == "header":
+            self.show_header(item[1], item[2])
+        else:
+            self.show_command(item[1], item[2], item_index)
+
+    def set_fg_color(self, color):
+        # Configuring a CTk frame redraws it, so only when the color actually changes
+        if color != self.fg_color:
+            self.fg_color = color
+            self.configure(fg_color=color)
+
+    def show_header(self, text, font_key):
+        self.set_fg_color("transparent")
+        self.configure(border_width=0)
+        self.is_selected = False
+        self.name_label.configure(text=text, font=self.fonts[font_key], text_color=self.style.HEADER_COLOR)
+        self.description_label.grid_remove()
+        self.origin_label.grid_remove()
+        self.action_label.grid_remove()
+
+    def show_command(self, command_tuple, is_history, idx):
+        name, description, action, target, origin, target_vars = command_tuple
+        self.set_fg_color(self.style.row_color(is_history, idx))
+
+        self.name_label.configure(
+            text=f"🕒 {name}" if is_history else name,
+            font=self.fonts["name"],
+            text_color=self.style.NAME_COLORS[is_history],
+        )
+
+        desc_text = description
+        var_len = len(command_tuple.variables)
+        if var_len:
+            desc_text = f"{description} - {var_len} var{'s' if var_len > 1 else ''}"
+        self.description_label.configure(text=desc_text)
+        self.description_label.grid()
+
+        if origin == "CUSTOM" and not is_history:
+            self.origin_label.grid()
+        else:
+            self.origin_label.grid_remove()
+
+        if is_history:
+            self.action_label.grid_remove()
+        else:
+            self.action_label.configure(text=action)
+            self.action_label.grid()
+
+    def set_selected(self, is_selected):
+        if is_selected == self.is_selected:
+            return
+        self.is_selected = is_selected
+        if is_selected:
+            self.configure(border_width=2, border_color=self.style.selection_color)
+        else:
+            self.configure(border_width=0)
+
+    def restyle(self):
+        if self.is_selected:
+            self.configure(border_color=self.style.selection_color)
+
+class ResultItems(Sequence):
+    # Items for VirtualResultList over a lazily loaded catalog: a few header and history
+    # items, then one command item per catalog entry, made when the row is drawn.
+    def __init__(self, head, commands):
+        self.head = head
+        self.commands = commands
+
+    def __len__(self):
+        return len(self.head) + len(self.commands)
+
+    def __getitem__(self, index):
+        if index < len(self.head):
+            return self.head[index]
+        return ("command", self.commands[index - len(self.head)], False)
+
+    def command_positions(self):
+        head_positions = [i for i, item in enumerate(self.head) if item[0] == "command"]
+        return ChainedCommands(head_positions, range(len(self.head), len(self)))
+
+class VirtualResultList(customtkinter.CTkFrame):
+    # Only as many ResultRow widgets as fit in the viewport are ever created. Scrolling and
+    # filtering rebind those rows to a window of self.items, so render cost does not depend
+    # on how many commands are in the catalog.
+    ROW_HEIGHT = 46
+
+    def __init__(self, master, label_text, label_font, on_click, on_shift_click, on_context, on_scroll, **kwargs):
+        super().__init__(master, **kwargs)
+        self.on_click = on_click
+        self.on_shift_click = on_shift_click
+        self.on_context = on_context
+        self.on_scroll = on_scroll
+
+        self.items = []
+        self.command_positions = []
+        self.offset = 0
+        self.visible_rows = 0
+        self.rows = []
+        self.selected_index = 0
+        self.style = ResultStyle()
+
+        self.grid_columnconfigure(0, weight=1)
+        self.grid_rowconfigure(1, weight=1)
+
+        self.label = customtkinter.CTkLabel(
+            self,
+            text=label_text,
+            font=label_font,
+            corner_radius=self.cget("corner_radius"),
+            fg_color=self.style.label_color,
+        )
+        self.label.grid(row=0, column=0, columnspan=2, sticky="ew", padx=3, pady=3)
+
+        self.body = customtkinter.CTkFrame(self, fg_color="transparent")
+        self.body.grid(row=1, column=0, sticky="nsew", padx=(3, 0), pady=3)
+        self.body.grid_columnconfigure(0, weight=1)
+        self.body.grid_propagate(False)
+        self.body.bind("<Configure>", self.resize_pool)
+        self.bind_scroll(self.body)
+
+        self.scrollbar = customtkinter.CTkScrollbar(self, command=self.scrollbar_command)
+        self.scrollbar.grid(row=1, column=1, sticky="ns", pady=3)
+
+    def configure(self, require_redraw=False, **kwargs):
+        if "label_text" in kwargs:
+            self.label.configure(text=kwargs.pop("label_text"))
+        super().configure(require_redraw=require_redraw, **kwargs)
+
+    def bind_scroll(self, widget):
+        if sys.platform.startswith("linux"):
+            widget.bind("<Button-4>", self.mouse_wheel, add=True)
+            widget.bind("<Button-5>", self.mouse_wheel, add=True)
+        else:
+            widget.bind("<MouseWheel>", self.mouse_wheel, add=True)
+
+    def resize_pool(self, event):
+        visible_rows = event.height // self.ROW_HEIGHT + 1
+        while len(self.rows) < visible_rows:
+            row = ResultRow(self.body, self.style)
+            for widget in row.widgets():
+                widget.bind("<Shift-Button-1>", lambda e, r=row: self.row_event(self.on_shift_click, e, r))
+                widget.bind("<Button-1>", lambda e, r=row: self.row_event(self.on_click, e, r))
+                widget.bind("<Button-3>", lambda e, r=row: self.row_event(self.on_context, e, r))
+                self.bind_scroll(widget)
+            self.rows.append(row)
+        self.visible_rows = visible_rows
+        self.scroll_to(self.offset)
+
+    def row_event(self, callback, event, row):
+        if row.item is None or row.item[0] != "command":
+            return
+        callback(event, row.item[1], row.command_index)
+
+    def set_items(self, items):
+        self.items = items
+        if isinstance(items, ResultItems):
+            self.command_positions = items.command_positions()
+        else:
+            self.command_positions = [i for i, item in enumerate(items) if item[0] == "command"]
+        self.selected_index = 0
+        self.offset = -1
+        self.scroll_to(0)
+
+    def command_count(self):
+        return len(self.command_positions)
+
+    def max_offset(self):
+        full_rows = max(self.visible_rows - 1, 1)
+        return max(len(self.items) - full_rows, 0)
+
+    def scroll_to(self, offset):
+        offset = max(0, min(offset, self.max_offset()))
+        if offset != self.offset:
+            self.on_scroll()
+        self.offset = offset
+        self.redraw()
+
+    def redraw(self):
+        command_index = bisect.bisect_left(self.command_positions, self.offset)
+        for position, row in enumerate(self.rows):
+            item_index = self.offset + position
+            if position >= self.visible_rows or item_index >= len(self.items):
+                row.item = None
+                row.grid_remove()
+                continue
+            item = self.items[item_index]
+            row.show(item, item_index, command_index)
+            if item[0] == "command":
+                row.set_selected(command_index == self.selected_index)
+                command_index += 1
+            else:
+                row.set_selected(False)
+            row.grid(row=position, column=0, sticky="ew", padx=5, pady=3)
+        self.update_scrollbar()
+
+    def update_scrollbar(self):
+        if not self.items:
+            self.scrollbar.set(0.0, 1.0)
+            return
+        shown = max(self.visible_rows - 1, 1)
+        self.scrollbar.set(self.offset / len(self.items), min((self.offset + shown) / len(self.items), 1.0))
+
+    def scrollbar_command(self, *args):
+        if args[0] == "moveto":
+            self.scroll_to(round(float(args[1]) * len(self.items)))
+        elif args[0] == "scroll":
+            self.scroll_to(self.offset + int(args[1]))
+
+    def mouse_wheel(self, event):
+        if sys.platform.startswith("win"):
+            delta = -int(event.delta / 120)
+        elif sys.platform == "darwin":
+            delta = -event.delta
+        else:
+            delta = -1 if event.num == 4 else 1
+        self.scroll_to(self.offset + delta)
+
+    def restyle(self):
+        # After a color theme change: only the pooled rows, however long the list is
+        self.style.load_theme()
+        self.label.configure(fg_color=self.style.label_color)
+        for row in self.rows:
+            row.restyle()
+
+    def set_selection(self, selected_index):
+        # Only the rows of the old and new selection change; every other row already shows
+        # the right state, since redraw() paints it for each row it binds
+        previous = self.row_for_command(self.selected_index)
+        self.selected_index = selected_index
+        if previous is not None:
+            previous.set_selected(False)
+        current = self.row_for_command(selected_index)
+        if current is not None:
+            current.set_selected(True)
+
+    def ensure_visible(self, command_index):
+        if not 0 <= command_index < len(self.command_positions):
+            return
+        item_index = self.command_positions[command_index]
+        full_rows = max(self.visible_rows - 1, 1)
+        if command_index == 0:
+            self.scroll_to(0)
+        elif item_index < self.offset:
+            self.scroll_to(item_index)
+        elif item_index >= self.offset + full_rows:
+            self.scroll_to(item_index - full_rows + 1)
+
+    def row_for_command(self, command_index):
+        # Rows are bound to consecutive items from self.offset, so the row showing a command
+        # is found from its item position without looking at the others
+        if not 0 <= command_index < len(self.command_positions):
+            return None
+        position = self.command_positions[command_index] - self.offset
+        if not 0 <= position < min(self.visible_rows, len(self.rows)):
+            return None
+        row = self.rows[position]
+        if row.item is None or row.command_index != command_index:
+            return None
+        return row
+
+class JobPanel(customtkinter.CTkFrame):
+    def __init__(self, master, on_cancel, on_hide):
+        super().__init__(master, corner_radius=10)
+        self.job = None
+        self.shown_lines = 0
+
+        self.grid_columnconfigure(0, weight=1)
+
+        self.title_label = customtkinter.CTkLabel(
+            self,
+            text="",
+            font=customtkinter.CTkFont(size=11, family="Lexend", weight="bold"),
+            anchor="w",
+        )
+        self.title_label.grid(row=0, column=0, sticky="ew", padx=10, pady=(5, 0))
+
+        self.cancel_button = customtkinter.CTkButton(
+            self,
+            text="Cancel",
+            width=70,
+            height=24,
+            command=on_cancel,
+            fg_color="#A51F1F",
+            hover_color="#801818"
+        )
+        self.cancel_button.grid(row=0, column=1, sticky="e", padx=(0, 5), pady=(5, 0))
+
+        customtkinter.CTkButton(
+            self,
+            text="Hide",
+            width=50,
+            height=24,
+            command=on_hide,
+            fg_color="gray",
+            hover_color="#555555"
+        ).grid(row=0, column=2, sticky="e", padx=(0, 10), pady=(5, 0))
+
+        self.output_box = customtkinter.CTkTextbox(
+            self,
+            height=90,
+            font=customtkinter.CTkFont(size=11, family="Courier"),
+            state="disabled",
+        )
+        self.output_box.grid(row=1, column=0, columnspan=3, sticky="ew", padx=10, pady=5)
+
+    def show_job(self, job):
+        self.job = job
+        self.shown_lines = 0
+        self.output_box.configure(state="normal")
+        self.output_box.delete("1.0", "end")
+        self.output_box.configure(state="disabled")
+        self.refresh()
+
+    def refresh(self):
+        if self.job is None:
+            return
+        job = self.job
+        if job.is_running():
+            self.title_label.configure(text=f"Running: {job.name} (pid {job.pid})")
+            self.cancel_button.configure(state="normal")
+        else:
+            status = f"exit code {job.exit_code}" if job.state != "cancelled" else "cancelled"
+            self.title_label.configure(text=f"{job.name}: {status}")
+            self.cancel_button.configure(state="disabled")
+
+        new_lines = job.read_output(self.shown_lines)
+        if new_lines:
+            self.shown_lines += len(new_lines)
+            self.output_box.configure(state="normal")
+            self.output_box.insert("end", "".join(new_lines))
+            self.output_box.see("end")
+            self.output_box.configure(state="disabled")
+
 class CTkinterApplication(customtkinter.CTk):
+    JOB_POLL_MS = 50
+    CATALOG_POLL_MS = 50
+    IMPORT_POLL_MS = 50
+    OVERLAY_REFRESH_MS = 500
+    NAVIGATION_FRAME_MS = 16
 
     def __init__(self):
         super().__init__()
-        self.default_commands = []
-        self.result_widgets = []
-        self.custom_command_file = "custom_commands.json"
+        startup_profile.mark("window")
+        # Catalog, search, history and launching live in the core; this class is the Tk front end
+        self.core = PaletteCore(commands.commands)
 
         self.geometry("600x400")
         self.resizable(width=False, height=False)
@@ -104,19 +545,31 @@ class CTkinterApplication(customtkinter.CTk):
         self.rowconfigure(1, weight=1)
         self.columnconfigure(0, weight=1)
 
-        self.history_file = "command_history.json"
-        self.command_history = []
-        self.load_history()
+        self.core.load_history()
 
         self.color_theme = "blue"
         self.appearance_mode = "Dark"
-        self.fuzzy_threshold = 60
-        self.new_commands = []
-        self.commands = commands.commands
+        self.search_debounce_ms = 80
+        self.import_policy = "skip"
+        self.command_import = None
         self.settings_window = None
-        self.load_command()
+        self.catalog_poll = None
+        self.summon_server = None
+        self.result_label = "Available commands"
+        self.keystroke_started = None
+        self.navigation_job = None
+        self.navigation_pending = False
+        self.latency_overlay = None
+        self.latency_dump_path = "latency_profile.json"
+        self.search_scheduler = SearchScheduler(
+            self,
+            search=latency_profile.wrap("search", self.core.search),
+            deliver=self.show_search_results,
+            debounce_ms=self.search_debounce_ms,
+        )
+        startup_profile.mark("history")
         self.selected_index = 0
-        self.filtered_commands = self.commands
+        self.filtered_commands = self.core.commands
 
         self.expanded_row_index = -1
         self.expanded_frame = None
@@ -137,31 +590,96 @@ class CTkinterApplication(customtkinter.CTk):
         self.search_entry.bind("<Return>", self.handle_return_key)
         self.search_entry.bind("<Shift-Return>", self.handle_return_key)
 
-        self.result_frame = customtkinter.CTkScrollableFrame(
+        self.result_frame = VirtualResultList(
             self,
-            corner_radius=15,
-            fg_color="transparent",
             label_text="Available commands",
             label_font=customtkinter.CTkFont(size=10, weight="bold"),
+            on_click=lambda e, cmd, row_idx: self.execute_command(cmd),
+            on_shift_click=lambda e, cmd, row_idx: self.toggle_argument_expansion(cmd, row_idx),
+            on_context=lambda e, cmd, row_idx: self.show_context_menu(e, cmd),
+            on_scroll=self.collapse_argument_expansion,
+            corner_radius=15,
+            fg_color="transparent",
         )
         self.result_frame.grid(row=1, column=0, sticky="nsew", padx=10, pady=(5, 10))
-        self.result_frame.grid_columnconfigure(0, weight=1)
+
+        self.watched_jobs = []
+        self.job_poll = None
+        self.job_panel = JobPanel(self, on_cancel=self.cancel_job, on_hide=self.hide_job_panel)
+        self.search_entry.bind("<Escape>", self.cancel_job)
 
         self.last_command = customtkinter.CTkLabel(
             self,
             text="Your last command will show here",
             font=customtkinter.CTkFont(size=11, family="Lexend"),
         )
-        self.last_command.grid(row=2, column=0, sticky="ew", padx=10, pady=10)
+        self.last_command.grid(row=3, column=0, sticky="ew", padx=10, pady=10)
 
         self.filter_query(None)
-        self.render_results(self.commands, self.command_history)
-        self.update_selection_visual()
-        self.after(1200, lambda : self.search_entry.focus())
+        self.search_entry.focus_set()
+        self.first_paint_done = False
+        self.bind("<Map>", self.on_map, add="+")
+        if latency_profile.enabled:
+            self.bind("<F12>", self.toggle_latency_overlay)
+            self.bind("<Shift-F12>", self.dump_latency_profile)
+        startup_profile.mark("widgets")
+
+    def on_map(self, event):
+        # Redraws for the freshly mapped window are idle tasks queued ahead of this one
+        if event.widget is self and not self.first_paint_done:
+            self.first_paint_done = True
+            self.after_idle(self.on_first_paint)
+
+    def on_first_paint(self):
+        startup_profile.mark("first paint")
+        self.search_entry.focus_set()
+        self.start_catalog_loader()
+
+    # The custom commands are loaded and indexed on the core's catalog loader thread once
+    # the window is up; the batches are picked up here and the view refreshed as they arrive
+    def start_catalog_loader(self):
+        if self.catalog_poll is not None or self.core.catalog_loaded:
+            return
+        self.core.start_loading(on_index_ready=lambda: startup_profile.mark("search index"))
+        self.catalog_poll = self.after(self.CATALOG_POLL_MS, self.poll_catalog)
+
+    def poll_catalog(self):
+        self.catalog_poll = None
+        arrived = self.core.drain_catalog()[0]
+        # Also true when a catalog change has already waited for the rest of the load
+        done = self.core.catalog_loaded
+        if done:
+            startup_profile.mark("catalog")
+            startup_profile.report()
+            if self.core.catalog_error:
+                self.last_command.configure(text=f"Error: {self.core.catalog_error}", text_color="red")
+        if arrived or done:
+            query = self.search_entry.get().lower()
+            if not query:
+                selected_index = self.selected_index
+                self.filter_query(None)
+                self.selected_index = min(selected_index, max(self.result_frame.command_count() - 1, 0))
+                self.update_selection_visual()
+            elif not self.search_scheduler.is_pending():
+                # The index already holds the batch, so a rerun refines the results
+                self.search_scheduler.schedule(query)
+            self.set_result_label(self.result_label)
+        if not done:
+            self.catalog_poll = self.after(self.CATALOG_POLL_MS, self.poll_catalog)
+
+    def set_result_label(self, text):
+        self.result_label = text
+        progress = self.core.loading_progress()
+        if progress is not None:
+            loaded, total = progress
+            text = f"{text}  (loading commands {loaded}{'' if total is None else f'/{total}'}...)"
+        self.result_frame.configure(label_text=text)
 
     def handle_return_key(self, event):
         is_shift_pressed = (event.state & 0x0001) != 0
-        if not self.result_widgets or self.selected_index >= len(self.filtered_commands):
+        if self.search_scheduler.is_pending():
+            self.filter_query(None)
+        if not self.result_frame.command_count() or self.selected_index >= len(self.filtered_commands):
             return
         command_tuple = self.filtered_commands[self.selected_index]
         if is_shift_pressed:
@@ -172,192 +690,67 @@ class CTkinterApplication(customtkinter.CTk):
             self.execute_selected_command()
 
     def update_selection_visual(self):
-        for i, row in enumerate(self.result_widgets):
-            if i == self.selected_index:
-                row.configure(border_width=2, border_color="#1F6AA5")
-            else:
-                row.configure(border_width=0)
+        self.result_frame.set_selection(self.selected_index)
 
+    # Arrow keys move selected_index right away, so Return always acts on the latest one,
+    # but the list is scrolled and repainted at most once per NAVIGATION_FRAME_MS: a held
+    # key's auto-repeat events in between are folded into the next frame's update
     def move_selection(self, event):
-        max_selection = len(self.result_widgets)-1
-        new_selection = self.selected_index
-
-        if event.keysym == "Up":
-            new_selection = self.selected_index - 1
-            if new_selection < 0:
-                new_selection = max_selection
-        elif event.keysym == "Down":
-            new_selection = (self.selected_index + 1) % (max_selection+1)
-
-        self.selected_index = new_selection
-        self.update_selection_visual()
-
-        selected_row = self.result_widgets[self.selected_index]
-        canvas = self.result_frame._parent_canvas
-
-        bbox = canvas.bbox("all")
-        if bbox is None:
-            return "break"
-
-        total_content_height = bbox[3]
-        if total_content_height == 0:
+        command_count = self.result_frame.command_count()
+        if not command_count:
             return "break"
+        step = -1 if event.keysym == "Up" else 1
+        self.selected_index = (self.selected_index + step) % command_count
+        if self.navigation_job is None:
+            self.show_selection()
+            self.navigation_job = self.after(self.NAVIGATION_FRAME_MS, self.flush_navigation)
+        else:
+            self.navigation_pending = True
+        return "break"
+
+    def flush_navigation(self):
+        self.navigation_job = None
+        if self.navigation_pending:
+            self.navigation_pending = False
+            self.show_selection()
+            self.navigation_job = self.after(self.NAVIGATION_FRAME_MS, self.flush_navigation)
+
+    def show_selection(self):
+        started = latency_profile.start()
+        self.result_frame.ensure_visible(self.selected_index)
+        self.update_selection_visual()
+        latency_profile.stop("selection", started)
 
-        y_pos = selected_row.winfo_y()
-        row_height = selected_row.winfo_height()
-
-        top_frac = y_pos / total_content_height
-        bottom_frac = (y_pos + row_height) / total_content_height
-
-        view_fracs = canvas.yview()
-        view_top_frac = view_fracs[0]
-        view_bottom_frac = view_fracs[1]
+    def render_results(self, result=None, history=None):
+        self.collapse_argument_expansion()
+        items = []
+        if history and not self.search_entry.get():
+            items.append(("header", "FREQUENT COMMANDS ", "recent_header"))
+            for command_tuple in history:
+                items.append(("command", command_tuple, True))
 
-        if top_frac < view_top_frac:
-            canvas.yview_moveto(top_frac)
+        items.append(("header", "ALL AVAILABLE COMMANDS ", "all_header"))
 
-        elif bottom_frac > view_bottom_frac:
-            scroll_amount = bottom_frac - view_bottom_frac
-            canvas.yview_moveto(view_top_frac + scroll_amount)
-        print(self.selected_index)
+        if result is not None and not isinstance(result, list):
+            # A view of the catalog (see PaletteCore.unlisted_commands): rows are built as
+            # they scroll into view, so nothing here walks the whole catalog
+            self.selected_index = 0
+            self.result_frame.set_items(ResultItems(items, result))
+            self.update_selection_visual()
+            return
 
-    def render_results(self, result=None, history=None):
-        self.clear_results()
-        idx = 0
-        if history and not self.search_entry.get():
-            customtkinter.CTkLabel(
-                self.result_frame,
-                text="RECENT COMMANDS ",
-                font=customtkinter.CTkFont(size=14, weight="bold", slant="italic"),
-                text_color="#B0B0B0"
-            ).grid(row=idx, column=0, sticky="w", padx=5, pady=(0, 5))
-            idx += 1
-
-            for i, command_tuple in enumerate(history):
-                name, desc, action, target, origin, target_vars = command_tuple
-                self.create_result_row(name, desc, action, target, origin, target_vars, idx, is_history=True)
-                idx += 1
+        for command_tuple in result or []:
+            items.append(("command", command_tuple, False))
 
-        customtkinter.CTkLabel(
-            self.result_frame,
-            text="ALL AVAILABLE COMMANDS ",
-            font=customtkinter.CTkFont(size=10, weight="bold", slant="italic"),
-            text_color="#B0B0B0"
-        ).grid(row=idx, column=0, sticky="w", padx=5, pady=(15, 0))
-        idx += 1
         self.selected_index = 0
+        self.result_frame.set_items(items)
         self.update_selection_visual()
 
-        if result:
-            history_4tuples = [cmd[:4] for cmd in self.command_history]
-            for i, command_tuple in enumerate(result):
-                name, description, action, target, origin, target_vars = command_tuple
-                if history and not self.search_entry.get():
-                    command_4tuple = (name, description, action, target)
-                    if command_4tuple in history_4tuples:
-                        continue
-                self.create_result_row(name, description, action, target, origin, target_vars, idx+i)
-        self.result_frame._parent_canvas.yview_moveto(0.0)
-
-    def clear_results(self):
-        for widget in self.result_widgets:
-            widget.destroy()
-        self.result_widgets = []
+    def collapse_argument_expansion(self):
+        if self.expanded_frame:
+            self.expanded_frame.destroy()
         self.expanded_frame = None
         self.expanded_row_index = -1
-        for widget in self.result_frame.winfo_children():
-            widget.destroy()
-
-    def create_result_row(self, name, description, action, target, origin, target_vars, idx, is_history=False):
-        full_command_tuple = (name, description, action, target, origin, target_vars)
-        left_click_handler = lambda e, cmd=full_command_tuple : self.execute_command(cmd)
-        right_click_handler = lambda e, cmd=full_command_tuple : self.show_context_menu(e, cmd)
-        shift_click_handler = lambda e, cmd=full_command_tuple, row_idx=len(self.result_widgets) : self.toggle_argument_expansion(cmd, row_idx)
-        if self.appearance_mode == "Dark":
-            result_row_color = "#2A2A2A" if idx % 2 == 0 else "#252525"
-            if is_history:
-                result_row_color = "#353535" if idx % 2 == 0 else "#3A3A3A"
-        else:
-            result_row_color = "#F2F2F2" if idx % 2 == 0 else "#FAFAFA"
-            if is_history:
-                result_row_color = "#DCDCDC" if idx % 2 == 0 else "#D2D2D2"
-
-        result_row = customtkinter.CTkFrame(
-            self.result_frame,
-            corner_radius=8,
-            fg_color=result_row_color,
-            height=40
-        )
-        result_row.command_data = full_command_tuple[:4]
-        result_row.grid_columnconfigure(1, weight=1)
-        result_row.grid_rowconfigure(0, weight=1)
-        result_row.grid(row=idx, column=0, sticky="ew", padx=5, pady=3)
-        result_row.bind("<Shift-Button-1>", shift_click_handler)
-        result_row.bind("<Button-1>", left_click_handler)
-        result_row.bind("<Button-3>", right_click_handler)
-        name_text = f"🕒 {name}" if is_history else name
-
-        name_label = customtkinter.CTkLabel(
-            result_row,
-            text=name_text,
-            font=customtkinter.CTkFont(size=13, weight="bold"),
-            anchor="w",
-            text_color="#10B981" if is_history else "white" if self.appearance_mode == "Dark" else "black",
-        )
-        name_label.grid(row=0, column=0, sticky="w", padx=(10, 0), pady=5)
-        name_label.bind("<Shift-Button-1>", shift_click_handler)
-        name_label.bind("<Button-1>", left_click_handler)
-        name_label.bind("<Button-3>", right_click_handler)
-        desc_text = description
-        if target_vars and len(target_vars) > 0:
-            var_len = len(target_vars)
-            desc_text = f"{description} - {var_len} var{'s' if var_len > 1 else ''}"
-
-        description_label = customtkinter.CTkLabel(
-            result_row,
-            text=desc_text,
-            font=customtkinter.CTkFont(size=12),
-            anchor="e",
-            text_color="#888888"
-        )
-        description_label.grid(row=0, column=1, sticky="ew", padx=10, pady=5)
-        description_label.bind("<Shift-Button-1>", shift_click_handler)
-        description_label.bind("<Button-1>", left_click_handler)
-        description_label.bind("<Button-3>", right_click_handler)
-
-        if origin=="CUSTOM" and not is_history:
-            origin_label = customtkinter.CTkLabel(
-                result_row,
-                text="CUSTOM",
-                font=customtkinter.CTkFont(size=10, family="Lexend", weight="bold"),
-                anchor="center",
-                text_color="#FACC15",
-                bg_color="#453A1B",
-                corner_radius=5,
-            )
-            origin_label.grid(row=0, column=2, sticky="e", padx=(0, 5), pady=5)
-            origin_label.bind("<Shift-Button-1>", shift_click_handler)
-            origin_label.bind("<Button-1>", left_click_handler)
-            origin_label.bind("<Button-3>", right_click_handler)
-
-        if is_history:
-            pass
-        else:
-            action_label = customtkinter.CTkLabel(
-                result_row,
-                text=action,
-                font=customtkinter.CTkFont(family="Lexend", size=10),
-                anchor="e",
-                text_color="white",
-                bg_color="#666666",
-                corner_radius=5,
-            )
-            action_label.grid(row=0, column=3, sticky="e", padx=(0, 10), pady=5)
-            action_label.bind("<Shift-Button-1>", shift_click_handler)
-            action_label.bind("<Button-1>", left_click_handler)
-            action_label.bind("<Button-3>", right_click_handler)
-
-        self.result_widgets.append(result_row)
 
     def toggle_argument_expansion(self, command_tuple, row_index):
         if self.expanded_frame:
@@ -370,19 +763,24 @@ class CTkinterApplication(customtkinter.CTk):
                 return
 
         name, desc, action, target, origin, target_vars = command_tuple
+        variables = command_tuple.variables
         print(origin)
 
-        if not target_vars:
+        if not variables:
             print("no target variables found")
             return
 
+        self.result_frame.ensure_visible(row_index)
+        target_row = self.result_frame.row_for_command(row_index)
+        if target_row is None:
+            return
         self.expanded_row_index = row_index
-        target_row = self.result_widgets[self.selected_index]
         self.expanded_frame = customtkinter.CTkFrame(target_row, fg_color="transparent")
         self.expanded_frame.grid(row=1, column=0, columnspan=4, sticky="ew", padx=10, pady=(0, 5))
         self.expanded_frame.entries = {}
 
-        for i, (var_name, default_value) in enumerate(target_vars.items()):
+        for i, var_name in enumerate(variables):
+            default_value = target_vars.get(var_name, "")
             label = customtkinter.CTkLabel(
                 self.expanded_frame,
                 text=f"{var_name}: ",
@@ -423,9 +821,9 @@ class CTkinterApplication(customtkinter.CTk):
         name, desc, action, target, origin, target_vars = command_tuple
         
         try:
-            final_target = target.format(**args)
-            final_command = (name, desc, action, final_target, origin, args)
-            self.execute_command(final_command)
+            final_target = command_tuple.render(args)
+            final_command = Command(name, desc, action, final_target, origin, args)
+            self.execute_command(final_command, final_target)
         except KeyError as e:
             self.last_command.configure(text=f"Error formatting command: {e}", text_color="red")
 
@@ -433,39 +831,85 @@ class CTkinterApplication(customtkinter.CTk):
         if event is not None:
             if event.keysym in ['Up', 'Down', 'Return', 'Shift_L', 'Shift_R']:
                 return
+        if event is not None:
+            # Timed from the last keystroke, since that is the query whose results get shown
+            self.keystroke_started = latency_profile.start()
         query = self.search_entry.get().lower()
-        self.filtered_commands = []
         if not query:
-            self.filtered_commands = self.command_history + [cmd for cmd in self.commands if cmd[:4] not in [cmmd[:4] for cmmd in self.command_history]]
-            self.result_frame.configure(label_text="Command History & All Commands")
-            self.render_results(self.commands, self.command_history)
+            self.search_scheduler.cancel()
+            history = self.core.command_history
+            unlisted = self.core.unlisted_commands()
+            self.filtered_commands = ChainedCommands(history, unlisted)
+            self.set_result_label("Command History & All Commands")
+            started = latency_profile.start()
+            self.render_results(unlisted, history)
             self.selected_index = 0
             self.update_selection_visual()
+            self.finish_render(started)
             return
-        else:
-            results = process.extract(
-                query,
-                [name.lower() for name, _, _, _, _, _ in self.commands],
-                scorer=fuzz.partial_ratio,
-                limit=12
-            )
-            names = [name for name, score in results if score >= self.fuzzy_threshold]
-
-            for name in names:
-                index = [name.lower() for name, _, _, _, _, _ in self.commands].index(name)
-                if self.commands[index] not in self.filtered_commands:
-                    self.filtered_commands.append(self.commands[index])
-                else:
-                    index = [name.lower() for name, _, _, _, _, _ in self.commands].index(name, index+1)
-                    self.filtered_commands.append(self.commands[index])
+        if event is not None:
+            self.search_scheduler.schedule(query)
+            return
+        self.search_scheduler.cancel()
+        self.show_search_results(query, self.core.search(query))
 
-            self.result_frame.configure(label_text=f"Showing result for \"{query}\" ({len(self.filtered_commands)} results)")
+    def show_search_results(self, query, results):
+        started = latency_profile.start()
+        self.filtered_commands = results
+        self.set_result_label(f"Showing result for \"{query}\" ({len(self.filtered_commands)} results)")
         self.render_results(self.filtered_commands)
         self.selected_index = 0
         self.update_selection_visual()
+        self.finish_render(started)
+
+    # Latency profiling (see latency_profile.py). "render" is rebinding the result rows,
+    # "layout" the Tk geometry and redraw work that runs as idle tasks after it, and
+    # "keystroke" the whole way from the key release to the results being drawn
+    def finish_render(self, started):
+        if started is None:
+            return
+        latency_profile.stop("render", started)
+        self.after_idle(self.finish_layout, time.perf_counter(), self.keystroke_started)
+        self.keystroke_started = None
+
+    def finish_layout(self, layout_started, keystroke_started):
+        latency_profile.stop("layout", layout_started)
+        latency_profile.stop("keystroke", keystroke_started)
+
+    def toggle_latency_overlay(self, event=None):
+        if self.latency_overlay is not None:
+            self.latency_overlay.destroy()
+            self.latency_overlay = None
+            return
+        self.latency_overlay = customtkinter.CTkLabel(
+            self,
+            text="",
+            font=customtkinter.CTkFont(family="Courier", size=10),
+            justify="left",
+            anchor="nw",
+            fg_color=("#E0E0E0", "#1A1A1A"),
+            corner_radius=6,
+        )
+        self.latency_overlay.place(relx=1.0, rely=1.0, x=-14, y=-48, anchor="se")
+        self.refresh_latency_overlay()
+
+    def refresh_latency_overlay(self):
+        if self.latency_overlay is None:
+            return
+        self.latency_overlay.configure(text=latency_profile.summary() + "\n(ms; F12 hides, Shift+F12 saves)")
+        self.latency_overlay.lift()
+        self.after(self.OVERLAY_REFRESH_MS, self.refresh_latency_overlay)
+
+    def dump_latency_profile(self, event=None):
+        try:
+            latency_profile.dump(self.latency_dump_path)
+        except OSError as e:
+            self.last_command.configure(text=f"Could not save the latency profile: {e}", text_color="red")
+            return
+        self.last_command.configure(text=f"Latency profile saved to {self.latency_dump_path}")
 
     def show_context_menu(self, event, command):
-        if command[4] != "CUSTOM":
+        if command.origin != "CUSTOM":
             return
         self.context_menu = tk.Menu(self, tearoff=0)
         self.context_menu.add_command(
@@ -484,7 +928,7 @@ class CTkinterApplication(customtkinter.CTk):
 
 
     def delete_confirmation_window(self, command):
-        name = command[0]
+        name = command.name
         message = f"Are you sure you want to permanently delete {name}?"
 
         self.message_box = ConfirmationWindow(
@@ -495,190 +939,222 @@ class CTkinterApplication(customtkinter.CTk):
         )
 
     def delete_command(self, command):
-        self.commands = [cmd for cmd in self.commands if cmd != command]
-        self.new_commands = [cmd for cmd in self.new_commands if cmd != command]
-        self.save_command()
+        self.core.remove_command(command)
         current_query = self.search_entry.get() # get query to refresh UI
-        command_4tuple = command[:4]
-        self.command_history = [cmd for cmd in self.command_history if cmd != command_4tuple]
-        self.save_history()
+        self.core.forget_launches(command)
         self.filter_query(None)
-        self.last_command.configure(text=f"Deleted command {command[0]}", text_color="#A51F1F")
+        self.last_command.configure(text=f"Deleted command {command.name}", text_color="#A51F1F")
 
     def execute_selected_command(self, *args):
-        print(self.filtered_commands)
-        command_to_execute = self.filtered_commands[self.selected_index]
-        if len(command_to_execute) == 5:
-            command_to_execute += ({},)
-        elif len(command_to_execute) == 4:
-            command_to_execute += ("BUILT-IN", {})
-        self.execute_command(command_to_execute)
-
-    def add_to_history(self, command):
-        if command in self.command_history:
-            self.command_history.remove(command)
-
-        self.command_history.insert(0, command)
-
-        max_history = 5
-        self.command_history = self.command_history[:max_history]
-
-        self.save_history()
-
-    def execute_command(self, command):
-        name, description, action, target, origin, target_vars = command
-        final_target = target
-        try:
-            if target_vars and len(target_vars) > 0:
-                default_vars = {key: value for key, value in target_vars.items()}
-                final_target = target.format(**default_vars)
-        except KeyError as e:
-            self.last_command.configure(text=f"Error: Missing default value for {e}", text_color="red")
-        if action == "WEB":
-            webbrowser.open_new_tab(final_target)
-        elif action == "SYSTEM":
-            subprocess.run(final_target, shell=True)
-        elif action == "OPEN":
-            subprocess.Popen(final_target, shell=True)
-        elif action == "CONSOLE":
+        self.execute_command(self.filtered_commands[self.selected_index])
+
+    def execute_command(self, command, final_target=None):
+        # final_target is passed when the variables are already filled in, so the braces
+        # left in it are not read as variables a second time
+        started = latency_profile.start()
+        name, action = command.name, command.action
+        missing = None
+        if final_target is None:
+            final_target, missing = self.core.resolve_target(command)
+        if missing is not None:
+            # Never launch a target with its variables still in braces
+            self.last_command.configure(text=f"Error: Missing default value for {missing} (Shift+Enter to fill it in)", text_color="red")
+            return
+        if action == "CONSOLE":
             if final_target == "exit":
-                self.destroy()
+                if self.summon_server is not None:
+                    self.hide()
+                else:
+                    self.destroy()
                 return
             if final_target == "setting-window":
                 if not hasattr(self, 'settings_window') or self.settings_window is None or self.settings_window.winfo_exists():
                     self.settings_window = SettingsWindow(self)
                 self.settings_window.focus()
+        else:
+            job = self.core.launch(command, final_target)
+            if job is not None:
+                self.watch_job(job)
 
-        self.add_to_history(command[:4] + ("HISTORY",) + command[5:])
+        self.core.record_launch(command)
 
-        self.last_command.configure(text=f"Last command executed: {name}", text_color="#000000" if customtkinter.get_appearance_mode() != "Dark" else "#FFFFFF")
+        if action != "SYSTEM" and action != "OPEN":
+            self.last_command.configure(text=f"Last command executed: {name}", text_color=ResultStyle.TEXT_COLOR)
         self.search_entry.delete(0, "end")
         self.filter_query()
-        self.result_frame.configure(label_text="Available commands")
-        self.render_results(self.filtered_commands, self.command_history)
-        self.selected_index = 0
-        self.update_selection_visual()
-
-    def load_history(self):
-        self.command_history = []
-        if os.path.exists(self.history_file):
-            try:
-                with open(self.history_file, "r") as f:
-                    loaded_list = json.load(f)
-                    for cmd in loaded_list:
-                        if len(cmd) == 4:
-                            self.command_history.append(tuple(cmd) + ("HISTORY", {}))
-                        elif len(cmd) == 5:
-                            self.command_history.append(tuple(cmd) + ({},))
-                        elif len(cmd) == 6:
-                            self.command_history.append(tuple(cmd))
-            except (FileNotFoundError, json.JSONDecodeError, IndexError):
-                print("Error loading command history file. Starting with an empty list.")
-                self.command_history = []
-
-    def save_history(self):
-        try:
-            with open(self.history_file, "w") as f:
-                json.dump([list(cmd) for cmd in self.command_history], f, indent=4)
-        except Exception as e:
-            print(f"An error occurred while saving the command history file: {e}")
-
-    # Load and save custom commands
-    def load_command(self):
-        self.new_commands = []
-        self.default_commands = [(cmd[0], cmd[1], cmd[2], cmd[3], "BUILT-IN", {}) for cmd in self.commands]
-        self.commands = self.default_commands
-        self.filtered_commands = self.commands
-        if os.path.exists(self.custom_command_file):
-            try:
-                with open(self.custom_command_file, "r") as f:
-                    for cmd in json.load(f):
-                        if len(cmd) == 5:
-                            self.new_commands.append(tuple(cmd) + ({},))
-                        elif len(cmd) == 4:
-                            self.new_commands.append(tuple(cmd) + ("CUSTOM", {}))
-                        elif len(cmd) == 6:
-                            self.new_commands.append(tuple(cmd))
-                self.commands += self.new_commands
-                self.filtered_commands = self.commands
-            except FileNotFoundError:
-                print("Error opening custom commands file")
-
-    def save_command(self):
-        try:
-            with open(self.custom_command_file, "w") as f:
-                json.dump([list(cmd) for cmd in self.new_commands], f, indent=4)
-        except:
-            print("An error occurred while saving the custom commands file")
+        self.set_result_label("Available commands")
+        latency_profile.stop("execute", started)
+
+    # SYSTEM/OPEN commands run as background jobs; last_command is only updated once they exit
+    def watch_job(self, job):
+        self.watched_jobs.append(job)
+        if job.capture_output:
+            previous_job = self.job_panel.job
+            if previous_job is not None and not previous_job.is_running():
+                self.core.job_runner.forget(previous_job.job_id)
+            self.job_panel.show_job(job)
+            self.job_panel.grid(row=2, column=0, sticky="ew", padx=10, pady=(0, 5))
+        if self.job_poll is None:
+            self.job_poll = self.after(self.JOB_POLL_MS, self.poll_jobs)
+
+    def poll_jobs(self):
+        self.job_poll = None
+        self.job_panel.refresh()
+        still_running = []
+        for job in self.watched_jobs:
+            if job.is_running():
+                still_running.append(job)
+            else:
+                self.finish_job(job)
+        self.watched_jobs = still_running
+        if self.watched_jobs:
+            self.job_poll = self.after(self.JOB_POLL_MS, self.poll_jobs)
+
+    def finish_job(self, job):
+        if job.state == "finished":
+            self.last_command.configure(text=f"Last command executed: {job.name}", text_color=ResultStyle.TEXT_COLOR)
+        elif job.state == "cancelled":
+            self.last_command.configure(text=f"Cancelled command {job.name}", text_color="orange")
+        else:
+            self.last_command.configure(text=f"Command {job.name} failed (exit code {job.exit_code})", text_color="red")
+        if job is not self.job_panel.job:
+            self.core.job_runner.forget(job.job_id)
+
+    def cancel_job(self, event=None):
+        job = self.job_panel.job
+        if job is None or not job.is_running():
+            running = self.core.job_runner.running_jobs()
+            if not running:
+                return
+            job = running[-1]
+        self.core.job_runner.cancel(job.job_id)
+
+    # Resident mode (see palette_daemon.py): the window is withdrawn instead of destroyed and
+    # shown again on request, with the search index, caches and catalog still warm
+    def start_resident(self, socket_path=None, show=False, query=None):
+        from palette_daemon import SummonServer
+        self.summon_server = SummonServer(self, self.handle_summon_request, socket_path).start()
+        self.protocol("WM_DELETE_WINDOW", self.hide)
+        # A withdrawn window is never painted, so start loading now rather than at first paint
+        self.start_catalog_loader()
+        if show:
+            self.summon(query)
+        else:
+            self.withdraw()
+
+    def handle_summon_request(self, request):
+        op = request.get("op")
+        if op == "summon":
+            self.summon(request.get("query"))
+            return {"ok": True}
+        if op == "quit":
+            self.after_idle(self.destroy)
+            return {"ok": True}
+        if op == "latency":
+            if not latency_profile.enabled:
+                return {"ok": False, "error": "the daemon was not started with --profile-latency"}
+            return {"ok": True, "phases": latency_profile.stats()}
+        return {"ok": False, "error": f"unknown request {op!r}"}
+
+    def summon(self, query=None):
+        self.search_entry.delete(0, "end")
+        if query:
+            self.search_entry.insert(0, query)
+        self.filter_query(None)
+        self.deiconify()
+        self.lift()
+        self.focus_force()
+        self.search_entry.focus_set()
+        self.search_entry.icursor("end")
+        # Flush the redraws so the reply to the client goes out once the window is up
+        self.update_idletasks()
+
+    def hide(self):
+        self.collapse_argument_expansion()
+        self.withdraw()
+
+    # Pending history lines and the store's journal are written out before the window goes
+    def destroy(self):
+        if latency_profile.enabled and self.latency_dump_path:
+            self.dump_latency_profile()
+        if self.summon_server is not None:
+            self.summon_server.close()
+        self.search_scheduler.cancel()
+        if self.catalog_poll is not None:
+            self.after_cancel(self.catalog_poll)
+        if self.navigation_job is not None:
+            self.after_cancel(self.navigation_job)
+        self.core.close()
+        super().destroy()
+
+    def hide_job_panel(self):
+        job = self.job_panel.job
+        if job is not None and not job.is_running():
+            self.core.job_runner.forget(job.job_id)
+            self.job_panel.job = None
+        self.job_panel.grid_remove()
+        self.search_entry.focus()
 
     def export_commands(self):
         self.file_path = filedialog.asksaveasfilename(
             title="Export Commands",
             defaultextension=".json",
-            filetypes=[("JSON Files", "*.json")],
+            filetypes=FILE_TYPES,
         )
         if not self.file_path:
             self.last_command.configure(text="Export cancelled", text_color="orange")
             return
 
+        # The format follows the extension: .json, .ndjson/.jsonl or .pcmd, each optionally .gz
         try:
-            export_data = [cmd[:4] for cmd in self.new_commands]
-            with open(self.file_path, "w") as f:
-                json.dump(export_data, f, indent=4)
-                self.last_command.configure(text="Export successful", text_color="green")
-        except:
+            exported_count = self.core.export_commands(self.file_path)
+            self.last_command.configure(text=f"Export successful ({exported_count} commands)", text_color="green")
+        except (OSError, TypeError, ValueError) as e:
+            print(f"An error occurred while exporting commands: {e}")
             self.last_command.configure(text="Export unsuccessful", text_color="red")
 
     def import_commands(self):
         self.file_path = filedialog.askopenfilename(
             title="Import Commands",
             defaultextension=".json",
-            filetypes=[("JSON Files", "*.json")],
+            filetypes=FILE_TYPES,
         )
         if not self.file_path:
             self.last_command.configure(text="Import cancelled", text_color="orange")
             return
 
-        try:
-            with open(self.file_path, "r") as f:
-                import_data = json.load(f)
-        except:
-            self.last_command.configure(text="Import unsuccessful", text_color="red")
+        if self.command_import is not None:
+            self.last_command.configure(text="An import is already running", text_color="orange")
             return
-
-        if not isinstance(import_data, list):
-            self.last_command.configure(text="File data does not seem to be in a list form", text_color="red")
+        self.command_import = self.core.start_import(self.file_path, self.import_policy)
+        self.last_command.configure(text="Importing commands...", text_color="orange")
+        self.after(self.IMPORT_POLL_MS, self.poll_import)
+
+    # The file is parsed on a worker thread; the result is applied here, on the Tk thread
+    def poll_import(self):
+        command_import = self.command_import
+        if command_import.state == "running":
+            self.last_command.configure(
+                text=f"Importing commands... {command_import.processed} read ({command_import.progress():.0%})",
+                text_color="orange")
+            self.after(self.IMPORT_POLL_MS, self.poll_import)
+            return
+        self.command_import = None
+        if command_import.state == "failed":
+            self.last_command.configure(text=f"Import unsuccessful: {command_import.error}", text_color="red")
             return
-        current_names = [cmd[0] for cmd in self.commands]
-        imported_count, skipped_count = 0, 0
-
-        for cmd_data in import_data:
-            if isinstance(cmd_data, list) and (len(cmd_data) == 4 or len(cmd_data) == 5):
-                name = cmd_data[0]
-                if name in current_names:
-                    skipped_count += 1
-                    continue
-
-                if len(cmd_data) == 4:
-                    new_command_tuple = tuple(cmd_data) + ("CUSTOM",)
-                else:
-                    new_command_tuple = tuple(cmd_data[:4]) + ("CUSTOM",)
-
-                self.new_commands.append(new_command_tuple)
-                current_names.append(name)
-                imported_count += 1
-            else:
-                skipped_count += 1
 
+        replaced = list(command_import.replaced.values())
+        imported_count = len(command_import.added) + len(replaced)
         if imported_count > 0:
-            self.save_command()
-            self.load_command()
+            self.core.apply_import(command_import)
             self.filter_query(None)
             self.last_command.configure(
-                text=f"Import successful! Added {imported_count} new commands. Skipped {skipped_count} invalid/duplicate commands.",
+                text=f"Import successful! Added {len(command_import.added)} new commands ({command_import.renamed} renamed), "
+                     f"overwrote {len(replaced)}. Skipped {command_import.skipped} invalid/duplicate commands.",
                 text_color="green")
         else:
-            self.last_command.configure(text=f"No new commands were imported. Skipped {skipped_count} commands.", text_color="orange")
+            self.last_command.configure(text=f"No new commands were imported. Skipped {command_import.skipped} commands.", text_color="orange")
 
 class SettingsWindow(customtkinter.CTkToplevel):
     def __init__(self, master):
@@ -686,7 +1162,7 @@ class SettingsWindow(customtkinter.CTkToplevel):
         self.protocol("WM_DELETE_WINDOW", self.close_window)
         self.master_app = master
         self.title("Settings and Custom Commands")
-        self.geometry("650x450")
+        self.geometry("650x620")
         self.transient(master)
         self.columnconfigure((0, 1), weight=1)
         self.rowconfigure(0, weight=1)
@@ -739,7 +1215,7 @@ class SettingsWindow(customtkinter.CTkToplevel):
 
         self.threshold_label = customtkinter.CTkLabel(
             self.appearance_frame,
-            text=f"score: {self.master_app.fuzzy_threshold}",
+            text=f"score: {self.master_app.core.fuzzy_threshold}",
             font=customtkinter.CTkFont(size=10, weight="bold")
         )
         self.threshold_label.grid(row=6, column=0, sticky="w", padx=20, pady=(0, 10))
@@ -752,29 +1228,68 @@ class SettingsWindow(customtkinter.CTkToplevel):
             command=self.change_threshold_slider,
             width=200
         )
-        self.threshold_slider.set(self.master_app.fuzzy_threshold)
+        self.threshold_slider.set(self.master_app.core.fuzzy_threshold)
         self.threshold_slider.grid(row=7, column=0, sticky="ew", padx=20, pady=(0, 10))
 
+        self.debounce_label = customtkinter.CTkLabel(
+            self.appearance_frame,
+            text=f"Search delay: {self.master_app.search_debounce_ms} ms",
+            font=customtkinter.CTkFont(size=10, weight="bold")
+        )
+        self.debounce_label.grid(row=8, column=0, sticky="w", padx=20, pady=(0, 10))
+
+        self.debounce_slider = customtkinter.CTkSlider(
+            self.appearance_frame,
+            from_=0,
+            to=500,
+            number_of_steps=50,
+            command=self.change_debounce_slider,
+            width=200
+        )
+        self.debounce_slider.set(self.master_app.search_debounce_ms)
+        self.debounce_slider.grid(row=9, column=0, sticky="ew", padx=20, pady=(0, 10))
+
         #Import/export settings
         customtkinter.CTkLabel(
             self.appearance_frame,
             text="Imports / Exports:",
             font=customtkinter.CTkFont(size=12, weight="bold")
-        ).grid(row=8, column=0, sticky="w", padx=20, pady=(0, 10))
+        ).grid(row=10, column=0, sticky="w", padx=20, pady=(0, 10))
+
+        customtkinter.CTkLabel(
+            self.appearance_frame,
+            text="On name conflict:"
+        ).grid(row=11, column=0, sticky="w", padx=20, pady=(0, 0))
+        self.import_policy_option_menu = customtkinter.CTkOptionMenu(
+            self.appearance_frame,
+            values=['Skip', 'Overwrite', 'Rename'],
+            command=self.change_import_policy,
+            width=200
+        )
+        self.import_policy_option_menu.grid(row=12, column=0, sticky="ew", padx=20, pady=(0, 10))
+        self.import_policy_option_menu.set(self.master_app.import_policy.capitalize())
 
         customtkinter.CTkButton(
             self.appearance_frame,
             text="Import",
             command=self.master_app.import_commands,
             corner_radius=5
-        ).grid(row=9, column=0, sticky="ew", padx=20, pady=(0, 10))
+        ).grid(row=13, column=0, sticky="ew", padx=20, pady=(0, 10))
 
         customtkinter.CTkButton(
             self.appearance_frame,
             text="Export",
             command=self.master_app.export_commands,
             corner_radius=5
-        ).grid(row=10, column=0, sticky="ew", padx=20, pady=(0, 10))
+        ).grid(row=14, column=0, sticky="ew", padx=20, pady=(0, 10))
+
+        self.cache_stats_label = customtkinter.CTkLabel(
+            self.appearance_frame,
+            text="",
+            font=customtkinter.CTkFont(size=10)
+        )
+        self.cache_stats_label.grid(row=15, column=0, sticky="w", padx=20, pady=(0, 10))
+        self.update_cache_stats()
 
         # Adding new Command settings
         self.add_command_frame = customtkinter.CTkFrame(
@@ -865,7 +1380,7 @@ class SettingsWindow(customtkinter.CTkToplevel):
 
     def check_target_for_vars(self, event=None):
         target_text = self.target_entry.get()
-        variables = set(re.findall(r'\{([^}]+)\}', target_text))
+        variables = TargetTemplate(target_text).variables
         if variables:
             self.manage_vars_button.grid(row=0, column=1, sticky="w", padx=20, pady=(0, 15))
         else:
@@ -874,7 +1389,7 @@ class SettingsWindow(customtkinter.CTkToplevel):
 
     def open_manage_vars_window(self):
         target_text = self.target_entry.get()
-        variables = sorted(list(set(re.findall(r'\{([^}]+)\}', target_text))))
+        variables = TargetTemplate(target_text).variables
 
         if not variables:
             return
@@ -891,24 +1406,40 @@ class SettingsWindow(customtkinter.CTkToplevel):
 
     def change_threshold_slider(self, value):
         value = int(value)
-        self.master_app.fuzzy_threshold = value
+        self.master_app.core.fuzzy_threshold = value
         self.threshold_label.configure(text=f"score: {value}")
+        # cached scores are threshold independent, so re-filtering on every slider step is cheap
+        if self.master_app.search_entry.get():
+            self.master_app.filter_query(None)
+        self.update_cache_stats()
+
+    def update_cache_stats(self):
+        stats = self.master_app.core.search_index.cache.stats()
+        self.cache_stats_label.configure(text=f"Search cache: {stats['hit_rate']:.0%} hits ({stats['hits']}/{stats['hits'] + stats['misses']})")
+
+    def change_import_policy(self, policy):
+        self.master_app.import_policy = policy.lower()
+
+    def change_debounce_slider(self, value):
+        value = int(value)
+        self.master_app.search_debounce_ms = value
+        self.master_app.search_scheduler.debounce_ms = value
+        self.debounce_label.configure(text=f"Search delay: {value} ms")
 
     def close_window(self):
         self.destroy()
         self.master_app.settings_window = None
 
+    # The result rows use (light, dark) color pairs that CTk switches itself, so neither
+    # change rebuilds the list (see ResultStyle)
     def change_appearance_mode(self, mode : str):
         customtkinter.set_appearance_mode(mode)
-        self.master_app.last_command.configure(text_color="#000000" if mode.lower() != "dark" else "#FFFFFF")
-        self.master_app.filter_query()
         self.master_app.appearance_mode = mode
-        self.master_app.render_results(self.master_app.filtered_commands, self.master_app.command_history)
 
     def change_color_theme(self, color : str):
         customtkinter.set_default_color_theme(color.lower())
         self.master_app.color_theme = color
-        self.master_app.render_results(self.master_app.filtered_commands, self.master_app.command_history)
+        self.master_app.result_frame.restyle()
 
     def reset_command_entry(self):
         self.name_entry.delete(0, "end")
@@ -929,16 +1460,18 @@ class SettingsWindow(customtkinter.CTkToplevel):
             self.status_label.configure(text="Name and Target cannot be left blank")
             return
 
-        if name in [cmd[0] for cmd in self.master_app.commands]:
-            self.status_label.configure(text=f"Command '{name}' already exists")
+        template = TargetTemplate(target)
+        if not template.valid:
+            self.status_label.configure(text=f"Malformed target: {template.error}")
             return
 
-        new_command = (name, description if description else "User's Custom Command", action_type, target, "CUSTOM", temp_target_vars)
-        self.master_app.commands.append(new_command)
-        self.master_app.new_commands.append(new_command)
+        if self.master_app.core.has_command_name(name):
+            self.status_label.configure(text=f"Command '{name}' already exists")
+            return
 
-        self.master_app.save_command()
-        self.master_app.render_results(self.master_app.commands, self.master_app.command_history)
+        new_command = Command(name, description if description else "User's Custom Command", action_type, target, "CUSTOM", temp_target_vars)
+        self.master_app.core.add_commands([new_command])
+        self.master_app.filter_query(None)
 
         self.reset_command_entry()
         self.status_label.configure(text=f"Command '{name}' was successfully added", text_color="green")
@@ -1059,7 +1592,7 @@ class EditCommandWindow(customtkinter.CTkToplevel):
 
     def check_target_for_vars(self, event=None):
         target_text = self.new_target_entry.get()
-        variables = set(re.findall(r"\{([^}]+)\}", target_text))
+        variables = TargetTemplate(target_text).variables
 
         if variables:
             self.manage_vars_button.grid(row=0, column=1, sticky="w", padx=(0, 20))
@@ -1069,7 +1602,7 @@ class EditCommandWindow(customtkinter.CTkToplevel):
 
     def open_manage_vars_window(self):
         target_text = self.new_target_entry.get()
-        variables = sorted(list(set(re.findall(r'\{([^}]+)\}', target_text))))
+        variables = TargetTemplate(target_text).variables
 
         if not variables:
             return
@@ -1105,25 +1638,47 @@ class EditCommandWindow(customtkinter.CTkToplevel):
         if not new_description:
             new_description = "User's custom command"
         original_target_vars = self.original_command[5] if len(self.original_command) == 6 else {}
-        new_command = (new_name, new_description, new_action_type, new_target, "CUSTOM", self.temp_target_vars)
+        # Keeps the original's id, so history and the result list follow the edit
+        new_command = Command(new_name, new_description, new_action_type, new_target, "CUSTOM", self.temp_target_vars, self.original_command.id)
         if not (new_name and new_target):
             self.status_label.configure(text="Name and Target cannot be left blank", text_color="#FA0000")
             return
+        template = TargetTemplate(new_target)
+        if not template.valid:
+            self.status_label.configure(text=f"Malformed target: {template.error}", text_color="#FA0000")
+            return
 
-        if new_name not in [cmd[0] for cmd in self.master_app.commands if cmd != self.original_command]:
-            self.master_app.commands = [tuple(cmd) for cmd in self.master_app.commands if cmd != self.original_command]
-            self.master_app.new_commands = [tuple(cmd) for cmd in self.master_app.new_commands if cmd != self.original_command]
-            self.master_app.command_history = [tuple(cmd) for cmd in self.master_app.command_history if cmd != self.original_command]
-            self.master_app.commands.append(new_command)
-            self.master_app.new_commands.append(new_command)
-            self.master_app.save_command()
+        if not self.master_app.core.has_command_name(new_name, ignore=self.original_command):
+            self.master_app.core.replace_command(self.original_command, new_command)
+            self.master_app.core.carry_over_launches(self.original_command, new_command)
             self.status_label.configure(text=f"command ({new_name}) successfully updated", text_color="#00FA00")
             self.master_app.filter_query(None)
-            self.master_app.render_results(self.master_app.filtered_commands, self.master_app.command_history)
             self.master_app.last_command.configure(text=f"Updated command: from - {self.old_name} to - {new_name}")
         else:
             self.status_label.configure(text=f"command ({new_name}) already exists", text_color="#FA0000")
 
 if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Command palette")
+    parser.add_argument("--profile-startup", action="store_true", help="print a phase-by-phase startup timing breakdown once the catalog is loaded")
+    parser.add_argument("--daemon", action="store_true", help="stay resident and hidden; palette_daemon.py summons the window")
+    parser.add_argument("--socket", help="socket path for --daemon")
+    parser.add_argument("--show", action="store_true", help="with --daemon, show the window right away")
+    parser.add_argument("--query", help="with --daemon --show, pre-fill the search box")
+    parser.add_argument("--profile-latency", action="store_true", help="time each phase of the keystroke to paint pipeline; F12 shows the overlay, Shift+F12 saves the timings")
+    parser.add_argument("--latency-overlay", action="store_true", help="profile latency and show the overlay from the start")
+    parser.add_argument("--latency-dump", default="latency_profile.json", help="where Shift+F12 and exiting save the latency timings (default: %(default)s)")
+    args = parser.parse_args()
+
     app = CTkinterApplication()
+    app.latency_dump_path = args.latency_dump
+    if args.latency_overlay:
+        app.toggle_latency_overlay()
+    if args.daemon:
+        try:
+            app.start_resident(args.socket, show=args.show, query=args.query)
+        except (OSError, RuntimeError) as e:
+            print(f"Could not start the palette daemon: {e}")
+            app.destroy()
+            sys.exit(1)
     app.mainloop()
@@ -0,0 +1,173 @@
+import itertools
+from target_template import TargetTemplate
+
+# Shared by every command without target variables instead of an empty dict apiece. Never
+# modify it; resolve_target and the settings windows copy target variables before changing them
+NO_VARS = {}
+NO_VARIABLES = ()
+
+_next_id = itertools.count(1)
+
+FIELDS = ("name", "description", "action", "target", "origin", "target_vars")
+
+
+class Command:
+    # One catalog entry. Commands used to be (name, description, action, target, origin,
+    # target_vars) tuples, and a Command still reads like one (command[0], command[:4],
+    # list(command)), so the stores, file formats and search index take either. Unlike a
+    # tuple it has a stable id: an edited command keeps the id of the one it replaces, and
+    # two commands are equal when their ids are, not their fields. `key` is the
+    # (name, description, action, target) identity history is recorded under across runs.
+    #
+    # Ids come from a process-wide counter; rows of a SQLite catalog use their negated
+    # rowid instead, so rereading a row gives the same id (see sqlite_store.py).
+    #
+    # The target is parsed into `template` once, here; targets without braces, most of
+    # them, need no parsing and have None there.
+    __slots__ = ("id", "template") + FIELDS
+
+    def __init__(self, name, description, action, target, origin="CUSTOM", target_vars=None, command_id=None):
+        self.id = next(_next_id) if command_id is None else command_id
+        self.name = name
+        self.description = description
+        self.action = action
+        self.target = target
+        self.template = TargetTemplate(target) if "{" in target or "}" in target else None
+        self.origin = origin
+        self.target_vars = target_vars or NO_VARS
+
+    @property
+    def key(self):
+        return (self.name, self.description, self.action, self.target)
+
+    @property
+    def variables(self):
+        return self.template.variables if self.template is not None else NO_VARIABLES
+
+    def render(self, values):
+        # The target with its variables filled in; KeyError for one missing from values
+        if self.template is None:
+            return self.target
+        return self.template.render(values)
+
+    @classmethod
+    def from_sequence(cls, fields, origin="CUSTOM", command_id=None):
+        # From a stored or imported list/tuple of 4, 5 or 6 fields
+        if isinstance(fields, Command):
+            return fields
+        if len(fields) == 4:
+            return cls(fields[0], fields[1], fields[2], fields[3], origin, command_id=command_id)
+        return cls(fields[0], fields[1], fields[2], fields[3], fields[4], fields[5] if len(fields) > 5 else None, command_id)
+
+    def with_origin(self, origin):
+        # The same command shown under another origin, e.g. as a HISTORY entry; keeps the id
+        return Command(self.name, self.description, self.action, self.target, origin, self.target_vars, self.id)
+
+    def fields(self):
+        return (self.name, self.description, self.action, self.target, self.origin, self.target_vars)
+
+    def __len__(self):
+        return 6
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self.fields()[index]
+        return getattr(self, FIELDS[index])
+
+    def __iter__(self):
+        return iter(self.fields())
+
+    def __eq__(self, other):
+        if not isinstance(other, Command):
+            return NotImplemented
+        return self.id == other.id
+
+    def __hash__(self):
+        return hash(self.id)
+
+    def __repr__(self):
+        return f"Command({self.id}, {self.name!r}, {self.action}, {self.origin})"
+
+
+class CommandRegistry:
+    # The in-memory catalog, in insertion order, with O(1) lookup by id and by name. When
+    # two commands share a name (a custom command saved under a built-in's name by an older
+    # version) the first registered one is the one found by name and the others wait in
+    # `shadowed`. ordered() is the list the result view shows, kept in step with every
+    # change along with each command's position in it: appends and edits are O(1), and a
+    # removal renumbers only the commands after it.
+    def __init__(self, commands=()):
+        self.by_id = {}
+        self.by_name = {}
+        self.shadowed = {}
+        self.ordered_commands = []
+        self.positions = {}
+        self.add_many(commands)
+
+    def __len__(self):
+        return len(self.by_id)
+
+    def __iter__(self):
+        return iter(self.by_id.values())
+
+    def __contains__(self, command):
+        return command.id in self.by_id
+
+    def get(self, command_id):
+        return self.by_id.get(command_id)
+
+    def find(self, name):
+        return self.by_name.get(name)
+
+    def position(self, command_id):
+        return self.positions.get(command_id)
+
+    def add(self, command):
+        self.add_many([command])
+
+    def add_many(self, commands):
+        for command in commands:
+            self.by_id[command.id] = command
+            self.register_name(command)
+            self.positions[command.id] = len(self.ordered_commands)
+            self.ordered_commands.append(command)
+
+    def replace(self, old_command, new_command):
+        # An edit keeps its place when the new command has the old one's id
+        if new_command.id != old_command.id:
+            self.remove(old_command)
+            self.add(new_command)
+            return
+        self.forget_name(old_command)
+        self.by_id[new_command.id] = new_command
+        self.register_name(new_command)
+        self.ordered_commands[self.positions[new_command.id]] = new_command
+
+    def remove(self, command):
+        if self.by_id.pop(command.id, None) is None:
+            return False
+        self.forget_name(command)
+        position = self.positions.pop(command.id)
+        del self.ordered_commands[position]
+        for index in range(position, len(self.ordered_commands)):
+            self.positions[self.ordered_commands[index].id] = index
+        return True
+
+    def register_name(self, command):
+        if self.by_name.setdefault(command.name, command) != command:
+            self.shadowed.setdefault(command.name, []).append(command)
+
+    def forget_name(self, command):
+        shadowed = self.shadowed.get(command.name)
+        if self.by_name.get(command.name) == command:
+            if shadowed:
+                self.by_name[command.name] = shadowed.pop(0)
+            else:
+                del self.by_name[command.name]
+        elif shadowed and command in shadowed:
+            shadowed.remove(command)
+        if not shadowed:
+            self.shadowed.pop(command.name, None)
+
+    def ordered(self):
+        return self.ordered_commands
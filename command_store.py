@@ -0,0 +1,254 @@
+import json
+import os
+import threading
+import time
+from collections.abc import Sequence
+from command_record import Command
+
+
+def command_from_json(cmd, command_id=None):
+    return Command.from_sequence(cmd, "CUSTOM", command_id)
+
+
+class CommandStore:
+    # Custom commands live in a snapshot file plus an append-only journal next to it. Each
+    # add, edit or delete appends one JSON line to the journal, so a change costs the same
+    # however many commands there are. Once the journal outgrows the catalog, a background
+    # thread writes a fresh snapshot to a temp file and renames it over the old one.
+    #
+    # Journal records carry increasing sequence numbers and the snapshot stores the last one
+    # it includes, so a crash at any point of a compaction replays correctly. A torn last
+    # line from a crash mid-append is skipped.
+    #
+    # A snapshot that cannot be parsed is moved aside to a ".corrupt-<time>" file rather
+    # than compacted over, and `load_error` says where it went. If it cannot be read or
+    # moved the store goes read-only: changes still apply in memory but nothing is written.
+    lazy = False
+    COMPACT_MIN_RECORDS = 200
+
+    def __init__(self, path):
+        self.path = path
+        self.journal_path = path + ".journal"
+        self.lock = threading.Lock()
+        self.commands = {}
+        self.sequence = 0
+        self.journal_records = 0
+        self.journal = None
+        self.torn_line = False
+        self.compaction = None
+        self.load_error = None
+        self.read_only = False
+
+    def load(self):
+        with self.lock:
+            self.commands = {}
+            self.sequence = 0
+            self.journal_records = 0
+            if os.path.exists(self.path):
+                try:
+                    self.load_snapshot()
+                except (ValueError, TypeError, KeyError, IndexError) as e:
+                    self.commands, self.sequence = {}, 0
+                    self.set_aside(e)
+                except OSError as e:
+                    self.fail(f"Could not read {self.path}: {e}")
+
+            if os.path.exists(self.journal_path):
+                try:
+                    with open(self.journal_path, "r") as f:
+                        for line in f:
+                            self.torn_line = not line.endswith("\n")
+                            try:
+                                record = json.loads(line)
+                            except json.JSONDecodeError:
+                                continue
+                            self.journal_records += 1
+                            if record["sequence"] > self.sequence:
+                                self.apply(record)
+                                self.sequence = record["sequence"]
+                except OSError as e:
+                    self.fail(f"Could not read {self.journal_path}: {e}")
+            commands = list(self.commands.values())
+        self.maybe_compact()
+        return commands
+
+    def load_snapshot(self):
+        with open(self.path, "r") as f:
+            data = json.load(f)
+        # Older versions saved a bare list of commands
+        if isinstance(data, dict):
+            self.sequence = data.get("sequence", 0)
+            data = data.get("commands", [])
+        for cmd in data:
+            command = command_from_json(cmd)
+            self.commands[command[0]] = command
+
+    def set_aside(self, error):
+        corrupt_path = f"{self.path}.corrupt-{time.strftime('%Y%m%d-%H%M%S')}"
+        try:
+            os.replace(self.path, corrupt_path)
+        except OSError as e:
+            self.fail(f"{self.path} is unreadable ({error}) and could not be moved aside: {e}")
+            return
+        self.load_error = f"{self.path} is unreadable ({error}); it was moved to {corrupt_path}"
+        print(self.load_error)
+
+    def fail(self, message):
+        self.read_only = True
+        self.load_error = f"{message}. Changes to custom commands will not be saved."
+        print(self.load_error)
+
+    def apply(self, record):
+        op = record["op"]
+        if op == "add":
+            for cmd in record["commands"]:
+                command = command_from_json(cmd)
+                self.commands[command[0]] = command
+        elif op == "edit":
+            old_command = self.commands.pop(record["name"], None)
+            command = command_from_json(record["command"], None if old_command is None else old_command.id)
+            self.commands[command[0]] = command
+        elif op == "delete":
+            self.commands.pop(record["name"], None)
+
+    def add(self, command):
+        self.add_many([command])
+
+    def add_many(self, commands):
+        if commands:
+            self.append({"op": "add", "commands": [list(command) for command in commands]})
+
+    def edit(self, old_command, new_command):
+        self.append({"op": "edit", "name": old_command[0], "command": list(new_command)})
+
+    def delete(self, command):
+        if command[0] in self.commands:
+            self.append({"op": "delete", "name": command[0]})
+
+    def append(self, record):
+        with self.lock:
+            self.sequence += 1
+            record["sequence"] = self.sequence
+            self.apply(record)
+            if self.read_only:
+                return
+            try:
+                if self.journal is None:
+                    self.journal = open(self.journal_path, "a")
+                # Start on a fresh line after a torn one so the record stays readable
+                self.journal.write(("\n" if self.torn_line else "") + json.dumps(record) + "\n")
+                self.torn_line = False
+                self.journal.flush()
+            except OSError as e:
+                print(f"An error occurred while saving the custom commands file: {e}")
+                return
+            self.journal_records += 1
+        self.maybe_compact()
+
+    def maybe_compact(self):
+        with self.lock:
+            if self.read_only or self.compaction is not None and self.compaction.is_alive():
+                return
+            if self.journal_records < max(self.COMPACT_MIN_RECORDS, len(self.commands)):
+                return
+            # Not a daemon thread, so a compaction in flight finishes before the app exits
+            self.compaction = threading.Thread(target=self.compact, name="command-store-compaction")
+            self.compaction.start()
+
+    def compact(self):
+        with self.lock:
+            snapshot = {"sequence": self.sequence, "commands": [list(command) for command in self.commands.values()]}
+            if self.journal is not None:
+                self.journal.flush()
+            journal_offset = os.path.getsize(self.journal_path) if os.path.exists(self.journal_path) else 0
+
+        temp_path = self.path + ".tmp"
+        try:
+            with open(temp_path, "w") as f:
+                json.dump(snapshot, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, self.path)
+        except OSError as e:
+            print(f"An error occurred while compacting the custom commands file: {e}")
+            return
+
+        # Keep only what was appended while the snapshot was being written
+        with self.lock:
+            try:
+                if self.journal is not None:
+                    self.journal.close()
+                    self.journal = None
+                with open(self.journal_path, "rb") as f:
+                    f.seek(journal_offset)
+                    tail = f.read()
+                with open(temp_path, "wb") as f:
+                    f.write(tail)
+                os.replace(temp_path, self.journal_path)
+                self.journal_records = tail.count(b"\n")
+            except OSError as e:
+                print(f"An error occurred while compacting the custom commands file: {e}")
+
+    def close(self):
+        if self.compaction is not None:
+            self.compaction.join()
+        with self.lock:
+            if self.journal is not None:
+                self.journal.close()
+                self.journal = None
+
+
+class ChainedCommands(Sequence):
+    # Concatenation of command sequences without copying them, e.g. the built-in list
+    # followed by a CommandPages view (see sqlite_store.py).
+    def __init__(self, *parts):
+        self.parts = parts
+
+    def __len__(self):
+        return sum(len(part) for part in self.parts)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        for part in self.parts:
+            if index < len(part):
+                return part[index]
+            index -= len(part)
+        raise IndexError("command index out of range")
+
+    def __iter__(self):
+        for part in self.parts:
+            yield from part
+
+
+class CommandsWithout(Sequence):
+    # A command sequence minus the items at a few positions, without copying it, e.g. the
+    # catalog less the commands already listed under FREQUENT COMMANDS. Each lookup steps
+    # over the skipped positions, so it costs O(len(skipped)).
+    def __init__(self, commands, skipped_positions):
+        self.commands = commands
+        self.skipped = sorted(set(skipped_positions))
+
+    def __len__(self):
+        return len(self.commands) - len(self.skipped)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("command index out of range")
+        for position in self.skipped:
+            if position > index:
+                break
+            index += 1
+        return self.commands[index]
+
+    def __iter__(self):
+        skipped = set(self.skipped)
+        for position, command in enumerate(self.commands):
+            if position not in skipped:
+                yield command
@@ -0,0 +1,134 @@
+import heapq
+import itertools
+import math
+import threading
+import time
+from command_record import Command
+
+
+def log_add(a, b):
+    if a < b:
+        a, b = b, a
+    return a + math.log1p(math.exp(b - a))
+
+
+class FrecencyRanker:
+    # Per-command launch counts with exponentially decayed scores. Every score decays at the
+    # same rate, so instead of decaying all of them as time passes, each new launch is
+    # weighted up: a launch at time t adds exp(rate * (t - epoch)) to the command's stored
+    # score, kept as a logarithm. The order of stored scores is then the order of current
+    # scores at any moment, and recording a launch is one O(log n) heap push. Heap entries
+    # left behind by later launches are skipped and dropped when they reach the top.
+    BOOST = 15
+
+    def __init__(self, half_life_days=7.0, epoch=None):
+        self.half_life_days = half_life_days
+        self.rate = math.log(2) / (half_life_days * 86400)
+        self.epoch = time.time() if epoch is None else epoch
+        self.entries = {}
+        self.heap = []
+        self.sequence = itertools.count()
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def record(self, key, command, when=None):
+        when = time.time() if when is None else when
+        weight = self.rate * (when - self.epoch)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                entry = self.entries[key] = [0, weight, when, command]
+            else:
+                entry[1] = log_add(entry[1], weight)
+            entry[0] += 1
+            entry[2] = max(entry[2], when)
+            entry[3] = command
+            self.push(key, entry)
+
+    def push(self, key, entry):
+        heapq.heappush(self.heap, (-entry[1], next(self.sequence), key))
+        if len(self.heap) > 2 * len(self.entries) + 64:
+            self.heap = [(-entry[1], next(self.sequence), key) for key, entry in self.entries.items()]
+            heapq.heapify(self.heap)
+
+    def forget(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def rename(self, old_key, new_key, command):
+        with self.lock:
+            if old_key == new_key:
+                # Same key, same score: the entry's heap item is still live, and pushing
+                # another would list the command twice
+                entry = self.entries.get(old_key)
+                if entry is not None:
+                    entry[3] = command
+                return
+            entry = self.entries.pop(old_key, None)
+            if entry is None:
+                return
+            entry[3] = command
+            self.entries[new_key] = entry
+            self.push(new_key, entry)
+
+    def link(self, commands):
+        # Points the entries recorded for these commands' keys at HISTORY copies of them,
+        # so an entry read from disk shares its catalog command's id
+        if not self.entries:
+            return
+        with self.lock:
+            for command in commands:
+                entry = self.entries.get(command.key)
+                if entry is not None and entry[3].id != command.id:
+                    entry[3] = command.with_origin("HISTORY")
+
+    def top(self, count):
+        with self.lock:
+            fresh = []
+            while self.heap and len(fresh) < count:
+                item = heapq.heappop(self.heap)
+                entry = self.entries.get(item[2])
+                if entry is not None and -item[0] == entry[1]:
+                    fresh.append(item)
+            for item in fresh:
+                heapq.heappush(self.heap, item)
+            return [(item[2], self.entries[item[2]]) for item in fresh]
+
+    def top_commands(self, count):
+        return [entry[3] for _, entry in self.top(count)]
+
+    def score(self, key, now=None):
+        entry = self.entries.get(key)
+        if entry is None:
+            return 0.0
+        now = time.time() if now is None else now
+        return math.exp(entry[1] - self.rate * (now - self.epoch))
+
+    def boosts(self, count=200, now=None):
+        # Ranking bonus, in fuzzy score points, for the `count` most frecent commands.
+        now = time.time() if now is None else now
+        boosts = {}
+        for key, entry in self.top(count):
+            score = math.exp(entry[1] - self.rate * (now - self.epoch))
+            boosts[key] = self.BOOST * score / (score + 1)
+        return boosts
+
+    def to_dict(self):
+        with self.lock:
+            return {
+                "half_life_days": self.half_life_days,
+                "epoch": self.epoch,
+                "entries": [[list(entry[3]), entry[0], entry[1], entry[2]] for entry in self.entries.values()],
+            }
+
+    @classmethod
+    def from_dict(cls, data):
+        ranker = cls(data.get("half_life_days", 7.0), data.get("epoch"))
+        for command, count, log_score, last_used in data.get("entries", []):
+            command = Command.from_sequence(command, "HISTORY")
+            ranker.entries[command.key] = [count, log_score, last_used, command]
+        ranker.heap = [(-entry[1], next(ranker.sequence), key) for key, entry in ranker.entries.items()]
+        heapq.heapify(ranker.heap)
+        return ranker
@@ -0,0 +1,139 @@
+import json
+import os
+import queue
+import threading
+import time
+from command_record import Command
+from frecency import FrecencyRanker
+
+
+class HistoryLog:
+    # Command history as a snapshot of the FrecencyRanker plus an append-only NDJSON log of
+    # the launches, forgets and renames since. The ranker is updated right away on the Tk
+    # thread; the log lines go through a queue to a writer thread that writes whatever has
+    # piled up in one go. After COMPACT_RECORDS lines the writer replaces the snapshot
+    # (temp file + rename) and starts a new log, so startup only replays the short tail.
+    #
+    # As in CommandStore, records are numbered and the snapshot keeps the last number it
+    # includes, so lines written after a compaction for older records are skipped on replay.
+    COMPACT_RECORDS = 500
+    BATCH_SIZE = 256
+
+    def __init__(self, path):
+        self.path = path
+        self.log_path = os.path.splitext(path)[0] + ".ndjson"
+        self.lock = threading.Lock()
+        self.ranker = FrecencyRanker()
+        self.sequence = 0
+        self.log_records = 0
+        self.torn_line = False
+        self.queue = queue.Queue()
+        self.writer = None
+
+    def load(self):
+        ranker, sequence = FrecencyRanker(), 0
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, "r") as f:
+                    loaded = json.load(f)
+                if isinstance(loaded, dict):
+                    ranker = FrecencyRanker.from_dict(loaded)
+                    sequence = loaded.get("sequence", 0)
+                else:
+                    # Old format: a most-recent-first list. Replay it as one launch each, a minute apart
+                    now = time.time()
+                    for position, cmd in reversed(list(enumerate(loaded))):
+                        cmd = Command.from_sequence(cmd, "HISTORY")
+                        ranker.record(cmd.key, cmd, now - 60 * position)
+            except (OSError, json.JSONDecodeError, IndexError, KeyError, TypeError, ValueError):
+                print("Error loading command history file. Starting with an empty list.")
+                ranker, sequence = FrecencyRanker(), 0
+
+        log_records = 0
+        if os.path.exists(self.log_path):
+            with open(self.log_path, "r") as f:
+                for line in f:
+                    self.torn_line = not line.endswith("\n")
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    log_records += 1
+                    if record["sequence"] > sequence:
+                        self.apply(ranker, record)
+                        sequence = record["sequence"]
+
+        with self.lock:
+            self.ranker, self.sequence, self.log_records = ranker, sequence, log_records
+        if self.writer is None:
+            self.writer = threading.Thread(target=self.run, name="history-writer", daemon=True)
+            self.writer.start()
+        return self.ranker
+
+    def apply(self, ranker, record):
+        op = record["op"]
+        if op == "launch":
+            command = Command.from_sequence(record["command"], "HISTORY")
+            ranker.record(command.key, command, record["at"])
+        elif op == "forget":
+            ranker.forget(tuple(record["key"]))
+        elif op == "rename":
+            command = Command.from_sequence(record["command"], "HISTORY")
+            ranker.rename(tuple(record["key"]), command.key, command)
+
+    def record(self, command, when=None):
+        when = time.time() if when is None else when
+        self.append({"op": "launch", "command": command, "at": when})
+
+    def forget(self, key):
+        self.append({"op": "forget", "key": list(key)})
+
+    def rename(self, old_key, command):
+        self.append({"op": "rename", "key": list(old_key), "command": command})
+
+    def append(self, record):
+        with self.lock:
+            self.apply(self.ranker, record)
+            self.sequence += 1
+            record["sequence"] = self.sequence
+            # Commands are applied as they are, keeping their ids, and written as lists
+            self.queue.put(json.dumps(record, default=list) + "\n")
+
+    def run(self):
+        while True:
+            lines = [self.queue.get()]
+            while len(lines) < self.BATCH_SIZE:
+                try:
+                    lines.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            if self.torn_line:
+                lines[0] = "\n" + lines[0]
+                self.torn_line = False
+            try:
+                with open(self.log_path, "a") as f:
+                    f.writelines(lines)
+                self.log_records += len(lines)
+                if self.log_records >= self.COMPACT_RECORDS:
+                    self.compact()
+            except OSError as e:
+                print(f"An error occurred while saving the command history file: {e}")
+            for _ in lines:
+                self.queue.task_done()
+
+    def compact(self):
+        with self.lock:
+            snapshot = self.ranker.to_dict()
+            snapshot["sequence"] = self.sequence
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "w") as f:
+            json.dump(snapshot, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.path)
+        # Everything logged so far is in the snapshot; queued lines land in the new log
+        open(self.log_path, "w").close()
+        self.log_records = 0
+
+    def flush(self):
+        self.queue.join()
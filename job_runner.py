@@ -0,0 +1,102 @@
+import itertools
+import os
+import signal
+import subprocess
+import threading
+
+
+class Job:
+    def __init__(self, job_id, name, target, capture_output):
+        self.job_id = job_id
+        self.name = name
+        self.target = target
+        self.capture_output = capture_output
+        self.process = None
+        self.pid = None
+        self.state = "starting"
+        self.exit_code = None
+        self.output = []
+        self.lock = threading.Lock()
+
+    def append_output(self, text):
+        with self.lock:
+            self.output.append(text)
+
+    def read_output(self, start):
+        with self.lock:
+            return self.output[start:]
+
+    def is_running(self):
+        return self.state in ("starting", "running")
+
+
+class JobRunner:
+    # Launches SYSTEM/OPEN targets without blocking the Tk thread. Each job gets a watcher
+    # thread that streams captured output into job.output and records the exit code; the
+    # UI polls the Job objects with after() since Tk must not be touched from here.
+    def __init__(self):
+        self.jobs = {}
+        self.job_ids = itertools.count(1)
+
+    def start(self, name, target, capture_output=True):
+        job = Job(next(self.job_ids), name, target, capture_output)
+        self.jobs[job.job_id] = job
+
+        if os.name == "posix":
+            group_kwargs = {"start_new_session": True}
+        else:
+            group_kwargs = {"creationflags": subprocess.CREATE_NEW_PROCESS_GROUP}
+
+        try:
+            job.process = subprocess.Popen(
+                target,
+                shell=True,
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.PIPE if capture_output else subprocess.DEVNULL,
+                stderr=subprocess.STDOUT if capture_output else subprocess.DEVNULL,
+                text=True,
+                errors="replace",
+                bufsize=1,
+                **group_kwargs
+            )
+        except OSError as e:
+            job.append_output(f"Could not start command: {e}\n")
+            job.state = "failed"
+            return job
+
+        job.pid = job.process.pid
+        job.state = "running"
+        threading.Thread(target=self.watch, args=(job,), name=f"job-{job.job_id}", daemon=True).start()
+        return job
+
+    def watch(self, job):
+        if job.process.stdout is not None:
+            for line in job.process.stdout:
+                job.append_output(line)
+            job.process.stdout.close()
+        exit_code = job.process.wait()
+        with job.lock:
+            job.exit_code = exit_code
+            if job.state != "cancelled":
+                job.state = "finished" if exit_code == 0 else "failed"
+
+    def cancel(self, job_id):
+        job = self.jobs.get(job_id)
+        if job is None or job.state != "running":
+            return False
+        with job.lock:
+            job.state = "cancelled"
+        try:
+            if os.name == "posix":
+                os.killpg(job.pid, signal.SIGTERM)
+            else:
+                job.process.terminate()
+        except (ProcessLookupError, PermissionError):
+            pass
+        return True
+
+    def running_jobs(self):
+        return [job for job in self.jobs.values() if job.is_running()]
+
+    def forget(self, job_id):
+        self.jobs.pop(job_id, None)
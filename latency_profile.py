@@ -0,0 +1,85 @@
+import collections
+import json
+import time
+
+BUCKET_EDGES_MS = [0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000]
+
+
+class LatencyProfile:
+    # Rolling timings for the keystroke -> paint pipeline and command execution, for
+    # `--profile-latency`. Each phase keeps its last WINDOW samples, from which the overlay
+    # and dump() work out percentiles and a histogram. When profiling is off, start()
+    # returns None, stop(phase, None) returns at once and wrap() hands back the function
+    # unchanged, so the calls can stay in the hot path. Samples are appended from the search
+    # worker thread too; deque.append does not need a lock for that.
+    WINDOW = 500
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.samples = {}
+        self.counts = collections.Counter()
+
+    def start(self):
+        if not self.enabled:
+            return None
+        return time.perf_counter()
+
+    def stop(self, phase, started):
+        if started is None:
+            return
+        self.record(phase, (time.perf_counter() - started) * 1000)
+
+    def record(self, phase, duration_ms):
+        samples = self.samples.get(phase)
+        if samples is None:
+            samples = self.samples.setdefault(phase, collections.deque(maxlen=self.WINDOW))
+        samples.append(duration_ms)
+        self.counts[phase] += 1
+
+    def wrap(self, phase, function):
+        if not self.enabled:
+            return function
+
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.record(phase, (time.perf_counter() - started) * 1000)
+        return timed
+
+    def stats(self):
+        stats = {}
+        for phase, samples in list(self.samples.items()):
+            ordered = sorted(samples)
+            if not ordered:
+                continue
+            histogram = [0] * (len(BUCKET_EDGES_MS) + 1)
+            edge = 0
+            for duration in ordered:
+                while edge < len(BUCKET_EDGES_MS) and duration > BUCKET_EDGES_MS[edge]:
+                    edge += 1
+                histogram[edge] += 1
+            stats[phase] = {
+                "count": self.counts[phase],
+                "window": len(ordered),
+                "last_ms": samples[-1],
+                "p50_ms": ordered[len(ordered) // 2],
+                "p90_ms": ordered[min(int(len(ordered) * 0.9), len(ordered) - 1)],
+                "p99_ms": ordered[min(int(len(ordered) * 0.99), len(ordered) - 1)],
+                "max_ms": ordered[-1],
+                # Samples at or below each edge (and above the previous one); the last bucket
+                # is everything slower than the final edge
+                "histogram": dict(zip([f"<={edge}" for edge in BUCKET_EDGES_MS] + [f">{BUCKET_EDGES_MS[-1]}"], histogram)),
+            }
+        return stats
+
+    def summary(self):
+        lines = [f"{'phase':<16}{'last':>7}{'p50':>7}{'p99':>7}{'max':>7}"]
+        for phase, stat in self.stats().items():
+            lines.append(f"{phase:<16}{stat['last_ms']:7.1f}{stat['p50_ms']:7.1f}{stat['p99_ms']:7.1f}{stat['max_ms']:7.1f}")
+        return "\n".join(lines)
+
+    def dump(self, path):
+        with open(path, "w") as f:
+            json.dump({"window": self.WINDOW, "bucket_edges_ms": BUCKET_EDGES_MS, "phases": self.stats()}, f, indent=2)
@@ -0,0 +1,144 @@
+import argparse
+import json
+import sys
+import time
+import commands
+from palette_core import PaletteCore
+
+OUTPUT_POLL_SECONDS = 0.05
+
+
+# Command line front end over PaletteCore, for scripts and for measuring search without
+# Tk in the way. Run as `python -m palette_cli <command> ...`:
+#
+#   query TEXT      print the best matches, as the palette would rank them
+#   run NAME        launch a command by name (SYSTEM output is streamed)
+#   import FILE     import commands from any format command_formats.py reads
+#   export FILE     export the custom commands, format by extension
+def build_parser():
+    parser = argparse.ArgumentParser(prog="python -m palette_cli", description="Command palette without the window")
+    parser.add_argument("--commands-file", help="custom commands file (default: $PALETTE_COMMANDS_FILE or custom_commands.json)")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    query = subparsers.add_parser("query", help="search the catalog")
+    query.add_argument("text", nargs="+")
+    query.add_argument("--limit", type=int, default=12)
+    query.add_argument("--threshold", type=int, default=60)
+    query.add_argument("--json", action="store_true", help="print one JSON array per result")
+    query.add_argument("--time", action="store_true", help="print load and search timings to stderr")
+
+    run = subparsers.add_parser("run", help="launch a command by name")
+    run.add_argument("name")
+    run.add_argument("--set", action="append", default=[], metavar="VAR=VALUE", help="fill in a target variable")
+
+    import_parser = subparsers.add_parser("import", help="import commands from a file")
+    import_parser.add_argument("file")
+    import_parser.add_argument("--policy", choices=["skip", "overwrite", "rename"], default="skip", help="what to do with name conflicts")
+
+    export = subparsers.add_parser("export", help="export the custom commands to a file")
+    export.add_argument("file")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    core = PaletteCore(commands.commands, commands_file=args.commands_file)
+    core.load_history()
+    try:
+        return COMMANDS[args.command](core, args)
+    finally:
+        core.close()
+
+
+def query_command(core, args):
+    started = time.perf_counter()
+    core.wait_for_catalog()
+    loaded = time.perf_counter()
+    results = core.search(" ".join(args.text), args.threshold, args.limit)
+    searched = time.perf_counter()
+    for command in results:
+        if args.json:
+            print(json.dumps(list(command[:5]), ensure_ascii=False))
+        else:
+            print(f"{command[0]}\t{command[2]}\t{command[3]}")
+    if args.time:
+        print(f"catalog: {len(core.commands)} commands loaded in {(loaded - started) * 1000:.1f} ms, "
+              f"search: {(searched - loaded) * 1000:.2f} ms", file=sys.stderr)
+    return 0
+
+
+def run_command(core, args):
+    command = core.find_command(args.name)
+    if command is None:
+        print(f"No command named {args.name!r}", file=sys.stderr)
+        suggestions = core.search(args.name, limit=5)
+        if suggestions:
+            print("Did you mean: " + ", ".join(cmd[0] for cmd in suggestions), file=sys.stderr)
+        return 1
+    overrides = dict(item.split("=", 1) for item in args.set if "=" in item)
+    final_target, missing = core.resolve_target(command, overrides)
+    if missing is not None:
+        print(f"Missing value for {missing}; pass it with --set {missing.args[0]}=...", file=sys.stderr)
+        return 1
+    if command[2] == "CONSOLE":
+        print(f"{command[0]} only works in the palette window", file=sys.stderr)
+        return 1
+
+    job = core.launch(command, final_target)
+    core.record_launch(command)
+    if job is None:
+        print(f"Opened {final_target}")
+        return 0
+    # Stream the output until the job ends; Ctrl+C cancels it like Escape does in the window
+    printed = 0
+    try:
+        while True:
+            running = job.is_running()
+            lines = job.read_output(printed)
+            printed += len(lines)
+            sys.stdout.write("".join(lines))
+            sys.stdout.flush()
+            if not running:
+                break
+            time.sleep(OUTPUT_POLL_SECONDS)
+    except KeyboardInterrupt:
+        core.job_runner.cancel(job.job_id)
+        print(f"Cancelled {command[0]}", file=sys.stderr)
+        return 130
+    if job.state == "failed":
+        print(f"Command {command[0]} failed (exit code {job.exit_code})", file=sys.stderr)
+        return job.exit_code or 1
+    return 0
+
+
+def import_command(core, args):
+    command_import = core.start_import(args.file, args.policy, threaded=False)
+    if command_import.state == "failed":
+        print(f"Import unsuccessful: {command_import.error}", file=sys.stderr)
+        return 1
+    core.apply_import(command_import)
+    print(f"Added {len(command_import.added)} new commands ({command_import.renamed} renamed), "
+          f"overwrote {len(command_import.replaced)}. Skipped {command_import.skipped} invalid/duplicate commands.")
+    return 0
+
+
+def export_command(core, args):
+    try:
+        exported_count = core.export_commands(args.file)
+    except (OSError, TypeError, ValueError) as e:
+        print(f"An error occurred while exporting commands: {e}", file=sys.stderr)
+        return 1
+    print(f"Exported {exported_count} commands to {args.file}")
+    return 0
+
+
+COMMANDS = {
+    "query": query_command,
+    "run": run_command,
+    "import": import_command,
+    "export": export_command,
+}
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,269 @@
+import os
+import queue
+import threading
+from catalog_loader import CatalogLoader
+from command_formats import write_commands
+from command_importer import CommandImport
+from command_record import Command, CommandRegistry
+from command_store import CommandStore, ChainedCommands, CommandsWithout
+from history_log import HistoryLog
+from job_runner import JobRunner
+
+
+def open_command_store(path):
+    # A .db path keeps custom commands in SQLite instead, for very large libraries
+    if path.endswith(".db"):
+        from sqlite_store import SQLiteCommandStore
+        return SQLiteCommandStore(path)
+    return CommandStore(path)
+
+
+class PaletteCore:
+    # Everything the palette does that needs no display: the catalog (built-ins plus the
+    # custom command store) and its search index, launch history, imports and exports, and
+    # launching commands. The Tk app (command_palette.py) and the command line front end
+    # (palette_cli.py) are both layers over it. Nothing here touches Tk, and nothing here
+    # waits on a thread except wait_for_catalog(); the app calls drain_catalog() and
+    # apply_import() from its own after() polls.
+    def __init__(self, builtins, commands_file=None, history_file="command_history.json", recent_limit=8):
+        self.commands_file = commands_file or os.environ.get("PALETTE_COMMANDS_FILE", "custom_commands.json")
+        self.command_store = open_command_store(self.commands_file)
+        self.history_log = HistoryLog(history_file)
+        self.recent_limit = recent_limit
+        self.fuzzy_threshold = 60
+        self.frecency = None
+        self.command_history = []
+        self.default_commands = [Command(cmd[0], cmd[1], cmd[2], cmd[3], "BUILT-IN") for cmd in builtins]
+        # Every command in memory by id and name; a SQLite catalog stays in the database
+        # and the registry only holds the built-ins (see lazy_commands)
+        self.registry = CommandRegistry(self.default_commands)
+        self.lazy_commands = None
+        self.catalog_loader = None
+        self.catalog_loaded = False
+        self.lock = threading.Lock()
+        self.job_runner = JobRunner()
+
+    # History. Each launch is recorded in O(log n) and written to disk by the history
+    # writer thread; command_history is the top of the frecency order
+    def load_history(self):
+        self.frecency = self.history_log.load()
+        self.link_history(self.default_commands)
+
+    def link_history(self, commands):
+        # History is kept under each command's key across runs; entries read from disk are
+        # given the ids of the catalog's commands as those load, so the views can tell
+        # history from catalog by id
+        self.frecency.link(commands)
+        self.command_history = self.frecency.top_commands(self.recent_limit)
+
+    def record_launch(self, command):
+        self.history_log.record(command.with_origin("HISTORY"))
+        self.command_history = self.frecency.top_commands(self.recent_limit)
+
+    def forget_launches(self, command):
+        self.history_log.forget(command.key)
+        self.command_history = self.frecency.top_commands(self.recent_limit)
+
+    def carry_over_launches(self, old_command, new_command):
+        if old_command is not None and old_command.key in self.frecency.entries:
+            if old_command.key == new_command.key:
+                # Only the variables changed; the log has nothing to record, and on the next
+                # load link() points the entry at the catalog command again
+                self.frecency.rename(old_command.key, new_command.key, new_command.with_origin("HISTORY"))
+            else:
+                self.history_log.rename(old_command.key, new_command.with_origin("HISTORY"))
+        self.command_history = self.frecency.top_commands(self.recent_limit)
+
+    # Catalog loading (see CatalogLoader). The search index pulls in thefuzz, rapidfuzz and
+    # numpy, so it is only built once something asks for it or loading starts
+    def start_loading(self, on_index_ready=None):
+        # Searches call this from the search worker thread, hence the lock
+        with self.lock:
+            if self.catalog_loader is not None:
+                return
+            self.catalog_loader = CatalogLoader(
+                self.command_store,
+                make_index=self.make_search_index,
+                builtins=self.default_commands,
+                on_index_ready=on_index_ready,
+            ).start()
+
+    def make_search_index(self):
+        if self.command_store.lazy:
+            from sqlite_store import FTSSearchIndex
+            return FTSSearchIndex(self.command_store)
+        from search_index import SearchIndex
+        return SearchIndex()
+
+    @property
+    def search_index(self):
+        self.start_loading()
+        self.catalog_loader.index_ready.wait()
+        return self.catalog_loader.index
+
+    @property
+    def commands(self):
+        # The whole catalog in display order, built-ins first
+        if self.lazy_commands is not None:
+            return self.lazy_commands
+        return self.registry.ordered()
+
+    def custom_commands(self):
+        if self.command_store.lazy:
+            return self.command_store.load()
+        self.wait_for_catalog()
+        return [cmd for cmd in self.registry if cmd.origin != "BUILT-IN"]
+
+    def drain_catalog(self):
+        # Moves the batches that have arrived into the registry. Returns whether any did
+        # and whether loading is now complete
+        arrived, done = False, False
+        while not self.catalog_loaded:
+            try:
+                batch = self.catalog_loader.batches.get_nowait()
+            except queue.Empty:
+                break
+            if batch is None:
+                self.catalog_loaded = done = True
+                break
+            arrived = True
+            if self.command_store.lazy:
+                self.lazy_commands = ChainedCommands(self.default_commands, batch)
+            else:
+                self.registry.add_many(batch)
+                self.link_history(batch)
+        return arrived, done
+
+    # Catalog changes and anything that needs every command wait for the loader
+    def wait_for_catalog(self):
+        self.start_loading()
+        if not self.catalog_loaded:
+            self.catalog_loader.thread.join()
+            return self.drain_catalog()
+        return False, False
+
+    @property
+    def catalog_error(self):
+        # Why the custom commands could not be loaded as they are, or None
+        return self.command_store.load_error
+
+    def loading_progress(self):
+        if self.catalog_loaded:
+            return None
+        if self.catalog_loader is None:
+            return 0, None
+        return self.catalog_loader.loaded, self.catalog_loader.total
+
+    # Catalog changes go through these so the command lists, the search index and the store
+    # stay in step with either kind of store
+    def find_command(self, name):
+        self.wait_for_catalog()
+        command = self.registry.find(name)
+        if command is None and self.command_store.lazy:
+            return self.command_store.find(name)
+        return command
+
+    def has_command_name(self, name, ignore=None):
+        # Whether a command other than `ignore` (the one being edited) has this name
+        self.wait_for_catalog()
+        named = [self.registry.find(name)] + self.registry.shadowed.get(name, [])
+        if self.command_store.lazy:
+            named.append(self.command_store.find(name))
+        return any(command is not None and command != ignore for command in named)
+
+    def add_commands(self, new_commands):
+        self.wait_for_catalog()
+        if not self.command_store.lazy:
+            self.registry.add_many(new_commands)
+            self.search_index.add_many(new_commands)
+        self.command_store.add_many(new_commands)
+
+    def replace_command(self, old_command, new_command):
+        # An edit keeps its id, and with it its place in the list
+        self.wait_for_catalog()
+        if not self.command_store.lazy:
+            self.registry.replace(old_command, new_command)
+            self.search_index.replace(old_command, new_command)
+        self.command_store.edit(old_command, new_command)
+
+    def remove_command(self, command):
+        self.wait_for_catalog()
+        if not self.command_store.lazy:
+            self.registry.remove(command)
+            self.search_index.remove(command)
+        self.command_store.delete(command)
+
+    # Imports and exports. The format follows the file: see command_formats.py
+    def start_import(self, path, policy="skip", threaded=True):
+        self.wait_for_catalog()
+        builtin_names = {cmd.name for cmd in self.default_commands}
+        if self.command_store.lazy:
+            names = self.command_store.names() | builtin_names
+            find_existing = self.command_store.find
+        else:
+            names = self.registry.by_name.keys()
+            find_existing = self.registry.find
+        command_import = CommandImport(path, names, builtin_names, find_existing, policy)
+        if threaded:
+            return command_import.start()
+        command_import.run()
+        return command_import
+
+    def apply_import(self, command_import):
+        # One store transaction for everything; overwritten commands keep their place
+        added = command_import.added
+        replaced = list(command_import.replaced.values())
+        if not self.command_store.lazy:
+            for old_command, new_command in replaced:
+                self.registry.replace(old_command, new_command)
+                self.search_index.replace(old_command, new_command)
+            self.registry.add_many(added)
+            self.search_index.add_many(added)
+        self.command_store.add_many([new_command for _, new_command in replaced] + added)
+        for old_command, new_command in replaced:
+            self.carry_over_launches(old_command, new_command)
+
+    def export_commands(self, path):
+        return write_commands(path, self.custom_commands())
+
+    # Search
+    def search(self, query, threshold=None, limit=12):
+        threshold = self.fuzzy_threshold if threshold is None else threshold
+        return self.search_index.search(query, threshold, limit, boosts=self.frecency.boosts())
+
+    def listing(self):
+        # What an empty query shows: the frequent commands, then the rest of the catalog
+        return ChainedCommands(self.command_history, self.unlisted_commands())
+
+    def unlisted_commands(self):
+        # A view of the catalog without the commands in command_history, found through the
+        # registry's positions; a SQLite catalog is shown whole
+        if self.lazy_commands is not None:
+            return self.lazy_commands
+        positions = (self.registry.position(command.id) for command in self.command_history)
+        return CommandsWithout(self.registry.ordered(), [position for position in positions if position is not None])
+
+    # Running commands. CONSOLE targets are the front end's business; launch() takes care
+    # of WEB, SYSTEM and OPEN and returns the Job for the last two
+    def resolve_target(self, command, overrides=None):
+        # Returns the target with its variables filled in, and the missing variable if any
+        values = command.target_vars
+        if overrides:
+            values = dict(values, **overrides)
+        try:
+            return command.render(values), None
+        except KeyError as e:
+            return command.target, e
+
+    def launch(self, command, final_target):
+        action = command.action
+        if action == "WEB":
+            import webbrowser
+            webbrowser.open_new_tab(final_target)
+        elif action == "SYSTEM" or action == "OPEN":
+            return self.job_runner.start(command.name, final_target, capture_output=(action == "SYSTEM"))
+        return None
+
+    def close(self):
+        self.history_log.flush()
+        self.command_store.close()
@@ -0,0 +1,194 @@
+import argparse
+import json
+import os
+import socket
+import sys
+import time
+
+READ_TIMEOUT = 0.5
+MAX_REQUEST_BYTES = 65536
+
+
+def default_socket_path():
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR") or os.environ.get("TMPDIR") or "/tmp"
+    return os.environ.get("PALETTE_SOCKET") or os.path.join(runtime_dir, f"command-palette-{os.getuid()}.sock")
+
+
+class SummonServer:
+    # The resident palette's end of the socket. Requests are one JSON line per connection
+    # and are served on the Tk thread from Tk file handlers, so an idle daemon costs
+    # nothing and a summon does not wait for an after() poll. A connection is read as its
+    # data arrives, never blocking the event loop on a slow client; one that has not sent
+    # a whole line within READ_TIMEOUT is dropped. `handle` gets the request dict and
+    # returns the reply dict; the reply also says how long handling took, which for a
+    # summon is the time until the window was shown.
+    def __init__(self, widget, handle, path=None):
+        self.widget = widget
+        self.handle = handle
+        self.path = path or default_socket_path()
+        self.listener = None
+        self.pending = {}
+
+    def start(self):
+        import tkinter
+        if os.path.exists(self.path):
+            if is_running(self.path):
+                raise RuntimeError(f"A palette daemon is already listening on {self.path}")
+            # Left behind by a daemon that did not shut down cleanly
+            os.unlink(self.path)
+        self.listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        old_umask = os.umask(0o077)
+        try:
+            self.listener.bind(self.path)
+        finally:
+            os.umask(old_umask)
+        self.listener.listen(8)
+        self.listener.setblocking(False)
+        self.widget.tk.createfilehandler(self.listener, tkinter.READABLE, self.accept)
+        return self
+
+    def accept(self, file, mask):
+        import tkinter
+        try:
+            connection, _ = self.listener.accept()
+        except BlockingIOError:
+            return
+        connection.setblocking(False)
+        timeout_job = self.widget.after(int(READ_TIMEOUT * 1000), self.drop, connection)
+        self.pending[connection] = [b"", time.perf_counter(), timeout_job]
+        self.widget.tk.createfilehandler(connection, tkinter.READABLE, lambda file, mask: self.read(connection))
+
+    def read(self, connection):
+        state = self.pending.get(connection)
+        if state is None:
+            return
+        try:
+            chunk = connection.recv(4096)
+        except BlockingIOError:
+            return
+        except OSError as e:
+            print(f"Ignoring a bad palette request: {e}")
+            self.drop(connection)
+            return
+        data = state[0] + chunk
+        if chunk and b"\n" not in data and len(data) < MAX_REQUEST_BYTES:
+            state[0] = data
+            return
+        self.release(connection)
+        with connection:
+            try:
+                request = json.loads(data.split(b"\n", 1)[0].decode("utf-8") or "null")
+            except ValueError as e:
+                print(f"Ignoring a bad palette request: {e}")
+                return
+            if not isinstance(request, dict):
+                return
+            reply = self.handle(request)
+            reply["handled_ms"] = (time.perf_counter() - state[1]) * 1000
+            try:
+                # A reply is far smaller than the socket buffer, so this does not block
+                connection.sendall((json.dumps(reply) + "\n").encode("utf-8"))
+            except OSError:
+                pass
+
+    def release(self, connection):
+        state = self.pending.pop(connection, None)
+        if state is None:
+            return False
+        self.widget.after_cancel(state[2])
+        self.widget.tk.deletefilehandler(connection)
+        return True
+
+    def drop(self, connection):
+        if self.release(connection):
+            connection.close()
+
+    def close(self):
+        if self.listener is None:
+            return
+        for connection in list(self.pending):
+            self.drop(connection)
+        self.widget.tk.deletefilehandler(self.listener)
+        self.listener.close()
+        self.listener = None
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+
+def send(request, path=None, timeout=5.0):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.settimeout(timeout)
+        client.connect(path or default_socket_path())
+        client.sendall((json.dumps(request) + "\n").encode("utf-8"))
+        return json.loads(client.makefile("r", encoding="utf-8").readline() or "{}")
+
+
+def is_running(path=None):
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+            client.settimeout(READ_TIMEOUT)
+            client.connect(path or default_socket_path())
+        return True
+    except OSError:
+        return False
+
+
+def start_daemon(query=None, path=None):
+    import subprocess
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "command_palette.py")
+    command = [sys.executable, script, "--daemon", "--show"]
+    if path:
+        command += ["--socket", path]
+    if query:
+        command += ["--query", query]
+    subprocess.Popen(command, stdin=subprocess.DEVNULL, start_new_session=True)
+
+
+# The hotkey client. It only needs the standard library, so it starts in a fraction of
+# the time the palette itself takes; the first call starts the daemon if none is running.
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Summon the resident command palette")
+    parser.add_argument("query", nargs="*", help="text to pre-fill the search box with")
+    parser.add_argument("--socket", help="socket path (default: $PALETTE_SOCKET or the runtime directory)")
+    parser.add_argument("--quit", action="store_true", help="stop the running daemon")
+    parser.add_argument("--latency", action="store_true", help="print the daemon's latency timings as JSON (needs --profile-latency)")
+    args = parser.parse_args(argv)
+    if not hasattr(socket, "AF_UNIX"):
+        print("Resident mode needs Unix domain sockets, which this platform does not have")
+        return 1
+
+    query = " ".join(args.query) or None
+    if args.quit:
+        request = {"op": "quit"}
+    elif args.latency:
+        request = {"op": "latency"}
+    else:
+        request = {"op": "summon", "query": query}
+    started = time.perf_counter()
+    try:
+        reply = send(request, args.socket)
+    except (FileNotFoundError, ConnectionRefusedError):
+        if args.quit or args.latency:
+            print("No palette daemon is running")
+            return 1
+        start_daemon(query, args.socket)
+        print("Started the palette daemon")
+        return 0
+    except (OSError, ValueError) as e:
+        print(f"Could not reach the palette daemon: {e}")
+        return 1
+    if not reply.get("ok"):
+        print(f"The palette daemon refused the request: {reply.get('error')}")
+        return 1
+    if args.latency:
+        print(json.dumps(reply["phases"], indent=2))
+    elif not args.quit:
+        print(f"Summoned in {(time.perf_counter() - started) * 1000:.1f} ms "
+              f"(window shown {reply['handled_ms']:.1f} ms after the request arrived)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,45 @@
+from collections import OrderedDict
+
+
+class QueryCache:
+    # LRU cache of merged search scores, keyed by (catalog version, processed query, limit).
+    # An entry remembers the threshold it was scored at and holds every candidate that
+    # reached it, so any stricter threshold is served by filtering the stored scores.
+    # Mutations bump the index's catalog version, which makes older keys unreachable; they
+    # age out of the LRU like any other entry.
+    def __init__(self, capacity=256):
+        self.capacity = capacity
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def lookup(self, key, threshold):
+        entry = self.entries.get(key)
+        if entry is None or entry[0] > threshold:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def store(self, key, threshold, scores):
+        self.entries[key] = (threshold, scores)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "size": len(self.entries),
+            "capacity": self.capacity,
+        }
@@ -0,0 +1,110 @@
+import os
+from thefuzz import process, fuzz
+
+try:
+    from rapidfuzz import process as rapid_process, fuzz as rapid_fuzz
+except ImportError:
+    rapid_process = None
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+# Scorer backends take a whole query-vs-catalog batch: a processed query and a dict of
+# id -> processed key (see thefuzz.utils.full_process). They return up to `limit`
+# (id, score) pairs ranked the way thefuzz.process.extract ranks them: by unrounded
+# partial_ratio, then by position in the dict, with the score rounded to an int.
+# extract_all also returns the rounded score of every choice, for callers that keep a
+# whole pass around (see FieldIndex in search_index.py).
+
+class TheFuzzScorer:
+    name = "thefuzz"
+
+    def extract(self, query, choices, limit):
+        results = process.extract(query, choices, processor=None, scorer=fuzz.partial_ratio, limit=limit)
+        return [(command_id, score) for _, score, command_id in results]
+
+    def extract_all(self, query, choices, limit):
+        scores = {command_id: score for _, score, command_id in process.extractWithoutOrder(query, choices, processor=None, scorer=fuzz.partial_ratio)}
+        return self.extract(query, choices, limit), scores
+
+
+class RapidFuzzScorer:
+    # Scores the batch in native code with no per-key Python calls. With numpy available
+    # the whole catalog goes through one cdist call split over `workers` threads;
+    # otherwise it falls back to a single-threaded rapidfuzz extract.
+    name = "rapidfuzz"
+
+    def __init__(self, workers=None):
+        self.workers = workers or os.cpu_count() or 1
+
+    def extract(self, query, choices, limit):
+        if not choices:
+            return []
+        ids = list(choices)
+        keys = list(choices.values())
+        if numpy is not None:
+            ranked = self.rank_cdist(self.cdist(query, keys), limit)
+        else:
+            ranked = [(score, index) for _, score, index in rapid_process.extract(query, keys, scorer=rapid_fuzz.partial_ratio, limit=limit)]
+        return [(ids[index], int(round(score))) for score, index in ranked]
+
+    def extract_all(self, query, choices, limit):
+        if not choices:
+            return [], {}
+        ids = list(choices)
+        keys = list(choices.values())
+        if numpy is not None:
+            scores = self.cdist(query, keys)
+            ranked = self.rank_cdist(scores, limit)
+            all_scores = dict(zip(ids, numpy.round(scores).astype(int).tolist()))
+        else:
+            results = rapid_process.extract(query, keys, scorer=rapid_fuzz.partial_ratio, limit=None)
+            ranked = [(score, index) for _, score, index in results[:limit]]
+            all_scores = {ids[index]: int(round(score)) for _, score, index in results}
+        return [(ids[index], int(round(score))) for score, index in ranked], all_scores
+
+    def cdist(self, query, keys):
+        return rapid_process.cdist([query], keys, scorer=rapid_fuzz.partial_ratio, dtype=numpy.float64, workers=self.workers)[0]
+
+    def rank_cdist(self, scores, limit):
+        if len(scores) > limit:
+            top = numpy.argpartition(-scores, limit - 1)[:limit]
+            # argpartition does not keep ties in catalog order; widen to every key tied
+            # with the limit-th score so the stable sort below can pick the earliest ones.
+            cutoff = scores[top].min()
+            top = numpy.flatnonzero(scores >= cutoff)
+        else:
+            top = numpy.arange(len(scores))
+        order = top[numpy.lexsort((top, -scores[top]))][:limit]
+        return [(float(scores[index]), int(index)) for index in order]
+
+
+SCORERS = {
+    TheFuzzScorer.name: TheFuzzScorer,
+    RapidFuzzScorer.name: RapidFuzzScorer,
+}
+
+
+def make_scorer(name=None):
+    if name is None:
+        name = RapidFuzzScorer.name if rapid_process is not None else TheFuzzScorer.name
+    return SCORERS[name]()
+
+
+def compare_backends(queries, choices, threshold, limit=12, backends=None):
+    # Parity check: every backend must return the same commands, in the same order, as
+    # the thefuzz reference at the given threshold. Returns the queries that differ.
+    reference = TheFuzzScorer()
+    backends = backends or [make_scorer(name) for name in SCORERS if name != TheFuzzScorer.name]
+    mismatches = []
+    for query in queries:
+        expected = [command_id for command_id, score in reference.extract(query, choices, limit) if score >= threshold]
+        for backend in backends:
+            got = [command_id for command_id, score in backend.extract(query, choices, limit) if score >= threshold]
+            if got != expected:
+                mismatches.append((backend.name, query, expected, got))
+    return mismatches
+
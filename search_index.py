@@ -0,0 +1,496 @@
+import heapq
+import math
+import threading
+from collections import Counter
+from functools import lru_cache
+from itertools import islice
+from thefuzz import utils
+from scorers import make_scorer
+from query_cache import QueryCache
+from target_template import TargetTemplate
+
+GRAM_SIZE = 3
+PRUNE_MIN_COMMANDS = 2000
+SEED_LIMIT = 256
+SCORE_EPSILON = 1e-6
+
+
+def normalize_key(text):
+    return text.lower()
+
+
+def key_grams(text):
+    return {text[i:i + GRAM_SIZE] for i in range(len(text) - GRAM_SIZE + 1)}
+
+
+def duplicate_gram_count(text):
+    return max(len(text) - GRAM_SIZE + 1, 0) - len(key_grams(text))
+
+
+@lru_cache(maxsize=4096)
+def shared_gram_bound(needle_length, score):
+    # Fewest trigram occurrences of the needle that must also occur in the haystack for
+    # fuzz.partial_ratio to round to at least `score`. partial_ratio is the best
+    # 200 * M / (len(needle) + len(window)) over windows no longer than the needle, where M
+    # is their LCS. Every needle char left out of the LCS breaks at most 3 needle trigrams
+    # and every gap in the window at most 2. Returns None when the score is unreachable.
+    bound = None
+    for window_length in range(1, needle_length + 1):
+        for matched in range(window_length + 1):
+            if 400 * matched < (2 * score - 1) * (needle_length + window_length):
+                continue
+            preserved = (needle_length - GRAM_SIZE + 1) - 3 * (needle_length - matched) - 2 * (window_length - matched)
+            if bound is None or preserved < bound:
+                bound = preserved
+    return bound
+
+
+@lru_cache(maxsize=256)
+def achievable_scores(needle_length):
+    # Every rounded partial_ratio a needle of this length can score, ascending.
+    return sorted({round(200 * matched / (needle_length + window_length))
+                   for window_length in range(1, needle_length + 1) for matched in range(window_length + 1)})
+
+
+@lru_cache(maxsize=4096)
+def refine_floor(query_length, added, score):
+    # Lowest rounded partial_ratio a key must have scored for a query for `added` more
+    # characters on the end to lift it to `score`. Only holds for keys longer than the
+    # extended query, where the query is the needle both times. Cutting the extended
+    # query's best window down to the old needle length and dropping the added characters
+    # loses at most `added` LCS matches, since both removals take a suffix of the
+    # alignment. Returns None when no key can reach `score`.
+    extended_length = query_length + added
+    for old_score in achievable_scores(query_length):
+        for window_length in range(1, extended_length + 1):
+            matched = min(window_length, (old_score + 0.5) * (query_length + min(window_length, query_length)) / 200 + added)
+            if 200 * matched / (extended_length + window_length) >= score - 0.5:
+                return old_score
+    return None
+
+
+class FieldIndex:
+    # Processed search keys of one command field, by command id. Large fields also keep a
+    # trigram inverted index over those keys. It is only used to skip commands that
+    # provably cannot reach the result list, so pruned searches return exactly what a
+    # full scan would.
+    #
+    # Large fields also remember the last pass that scored whole sets of keys: its query,
+    # the scores, and a floor no unscored key reaches. A query typed on the end of that one
+    # only rescores the keys refine_floor() cannot rule out (see refined_candidates).
+    def __init__(self, scorer):
+        self.scorer = scorer
+        self.processed = {}
+        self.ids_by_gram = {}
+        self.ids_by_length = {}
+        self.duplicate_grams = {}
+        self.last_pass = None
+        self.refine = True
+
+    def __len__(self):
+        return len(self.processed)
+
+    def add(self, command_id, text):
+        processed = utils.full_process(text)
+        if not processed:
+            return
+        self.last_pass = None
+        self.processed[command_id] = processed
+        self.ids_by_length.setdefault(len(processed), set()).add(command_id)
+        grams = key_grams(processed)
+        for gram in grams:
+            self.ids_by_gram.setdefault(gram, set()).add(command_id)
+        duplicates = max(len(processed) - GRAM_SIZE + 1, 0) - len(grams)
+        if duplicates:
+            self.duplicate_grams[command_id] = duplicates
+
+    def remove(self, command_id):
+        processed = self.processed.pop(command_id, None)
+        if processed is None:
+            return
+        self.last_pass = None
+        self.ids_by_length[len(processed)].discard(command_id)
+        for gram in key_grams(processed):
+            ids = self.ids_by_gram[gram]
+            ids.discard(command_id)
+            if not ids:
+                del self.ids_by_gram[gram]
+        self.duplicate_grams.pop(command_id, None)
+
+    def top(self, processed_query, threshold, limit):
+        if not processed_query or not self.processed:
+            return []
+        if len(self.processed) < PRUNE_MIN_COMMANDS:
+            return self.extract(processed_query, self.processed, threshold, limit)
+
+        # Trigram pruning is the cheaper of the two when it works, but leaves no single floor
+        # for the keys it skipped, so only the passes after it can be refined.
+        if len(processed_query) >= GRAM_SIZE:
+            candidate_ids = self.candidate_ids(processed_query, threshold, limit)
+            if candidate_ids is not None:
+                self.last_pass = None
+                return self.extract(processed_query, self.choices(candidate_ids), threshold, limit)
+        refined = self.refined_candidates(processed_query, threshold, limit) if self.refine else None
+        candidate_ids, floor = refined if refined is not None else (None, 0)
+
+        choices = self.processed if candidate_ids is None else self.choices(candidate_ids)
+        results, scores = self.scorer.extract_all(processed_query, choices, limit)
+        self.last_pass = (processed_query, floor, scores)
+        return [(command_id, score) for command_id, score in results if score >= threshold]
+
+    def extract(self, processed_query, choices, threshold, limit):
+        return [(command_id, score) for command_id, score in self.scorer.extract(processed_query, choices, limit) if score >= threshold]
+
+    def choices(self, command_ids):
+        return {command_id: self.processed[command_id] for command_id in sorted(command_ids)}
+
+    def score_ids(self, processed_query, command_ids, threshold):
+        choices = {command_id: self.processed[command_id] for command_id in command_ids if command_id in self.processed}
+        if not processed_query or not choices:
+            return []
+        return [(command_id, score) for command_id, score in self.scorer.extract(processed_query, choices, len(choices)) if score >= threshold]
+
+    def refined_candidates(self, processed_query, threshold, limit):
+        # (ids that could make the top `limit`, floor no other key reaches) when the query
+        # extends the last pass's query, or None.
+        if self.last_pass is None:
+            return None
+        last_query, last_floor, last_scores = self.last_pass
+        added = len(processed_query) - len(last_query)
+        if added <= 0 or not processed_query.startswith(last_query):
+            return None
+
+        # As in candidate_ids, score the likeliest keys first: if `limit` of them reach the
+        # threshold, the worst of them is the bar for everything else.
+        floor = threshold
+        best = refine_floor(len(last_query), added, 100)
+        if best is not None:
+            seeds = list(islice((command_id for command_id, score in last_scores.items() if score >= best), SEED_LIMIT))
+            if len(seeds) >= limit:
+                seed_results = self.scorer.extract(processed_query, self.choices(seeds), limit)
+                if len(seed_results) == limit and seed_results[-1][1] > threshold:
+                    floor = seed_results[-1][1]
+
+        required = refine_floor(len(last_query), added, floor)
+        if required is None:
+            candidate_ids = set()
+        elif required < last_floor:
+            return None
+        else:
+            candidate_ids = {command_id for command_id, score in last_scores.items() if score >= required}
+        # refine_floor says nothing about keys no longer than the query, so they are rescored.
+        for length, ids in self.ids_by_length.items():
+            if length <= len(processed_query):
+                candidate_ids.update(ids)
+        return candidate_ids, floor
+
+    def candidate_ids(self, processed_query, threshold, limit):
+        # Returns every command that could make the top `limit`, or None for a full scan.
+        # Scorers rank by score, then by catalog order, which is id order here.
+        query_grams = key_grams(processed_query)
+        postings = sorted((self.ids_by_gram[gram] for gram in query_grams if gram in self.ids_by_gram), key=len)
+
+        # Score the first few commands sharing most of the query's trigrams. If they already
+        # fill the result list, the last of them is the bar every other command must clear:
+        # the same score with a lower id, or a strictly higher score.
+        score, cutoff_id = threshold, None
+        if postings:
+            seeds = postings[0]
+            for ids in postings[1:]:
+                narrowed = seeds & ids
+                if len(narrowed) >= limit:
+                    seeds = narrowed
+            if len(seeds) >= limit:
+                seed_choices = {command_id: self.processed[command_id] for command_id in heapq.nsmallest(SEED_LIMIT, seeds)}
+                seed_results = self.scorer.extract(processed_query, seed_choices, limit)
+                if len(seed_results) == limit and seed_results[-1][1] >= threshold:
+                    cutoff_id, score = seed_results[-1]
+
+        query_length = len(processed_query)
+        query_duplicates = duplicate_gram_count(processed_query)
+        levels = [self.gram_requirements(query_length, query_duplicates, score)]
+        if cutoff_id is not None:
+            levels.append(self.gram_requirements(query_length, query_duplicates, score + 1))
+        if any(level is not None and level[0] <= 0 for level in levels):
+            return None
+
+        def level_for(command_id):
+            return levels[0] if cutoff_id is None or command_id <= cutoff_id else levels[-1]
+
+        candidates = set()
+        for level in levels:
+            if level is not None:
+                for length in level[2]:
+                    candidates.update(command_id for command_id in self.ids_by_length[length] if level_for(command_id) is level)
+
+        requirements = [required for level in levels if level is not None for required in (level[0], *level[1].values())]
+        counts = None
+        if requirements and min(requirements) >= len(query_grams):
+            if len(postings) == len(query_grams):
+                shared = set(postings[0])
+                for ids in postings[1:]:
+                    shared &= ids
+                for command_id in shared:
+                    level = level_for(command_id)
+                    if level is not None and (len(self.processed[command_id]) >= query_length or len(self.processed[command_id]) in level[1]):
+                        candidates.add(command_id)
+        elif requirements:
+            counts = Counter()
+            for ids in postings:
+                counts.update(ids)
+            minimum = min(requirements)
+            for command_id in [command_id for command_id, count in counts.items() if count >= minimum]:
+                level = level_for(command_id)
+                if level is None:
+                    continue
+                length = len(self.processed[command_id])
+                required = level[0] if length >= query_length else level[1].get(length)
+                if required is not None and counts[command_id] >= required:
+                    candidates.add(command_id)
+
+        # Trigrams repeated inside a key count once in the inverted index, so those few
+        # commands get their own, looser requirement.
+        for command_id, duplicates in self.duplicate_grams.items():
+            length = len(self.processed[command_id])
+            if length > query_length:
+                continue
+            level_score = score if cutoff_id is None or command_id <= cutoff_id else score + 1
+            bound = shared_gram_bound(length, level_score)
+            if bound is None:
+                continue
+            required = bound - max(duplicates, query_duplicates) if length == query_length else bound - duplicates
+            if counts is not None:
+                shared_count = counts[command_id]
+            else:
+                shared_count = len(query_grams & key_grams(self.processed[command_id]))
+            if shared_count >= required:
+                candidates.add(command_id)
+
+        if len(candidates) * 2 > len(self.processed):
+            return None
+        return candidates
+
+    def gram_requirements(self, query_length, query_duplicates, score):
+        # (shared trigrams needed by keys at least as long as the query, the same per shorter
+        # key length, shorter lengths that cannot be pruned at all), or None if unreachable.
+        long_bound = shared_gram_bound(query_length, score)
+        if long_bound is None:
+            return None
+        required_short = {}
+        unprunable_lengths = []
+        for length in range(query_length):
+            bound = shared_gram_bound(length, score)
+            if bound is None or not self.ids_by_length.get(length):
+                continue
+            if bound <= 0:
+                unprunable_lengths.append(length)
+            else:
+                required_short[length] = bound
+        return long_bound - query_duplicates, required_short, unprunable_lengths
+
+
+class SearchIndex:
+    # Keeps the normalized search keys of every command next to the command itself so
+    # filter_query never has to rebuild key lists or call list.index() per keystroke.
+    # Entries get a private integer id and each field is scored as one id->processed key
+    # batch by a scorer backend (see scorers.py), which hands the ids back with every
+    # match. The lock lets the search worker score while the Tk thread adds or removes
+    # commands.
+    #
+    # Name, description and target variable names are FieldIndexes; action types are few,
+    # so each distinct action is scored once. A command's score is its best weighted field
+    # score. Every field returns its own exact top `limit`, and no command outside all of
+    # them can beat the merged top `limit`.
+    #
+    # Merged scores are cached per query (see query_cache.py). Every add or remove bumps
+    # `version`, so edits, deletes and imports invalidate the cache on their own.
+    FIELD_WEIGHTS = {"name": 1.0, "description": 0.8, "variables": 0.7, "action": 0.6}
+
+    def __init__(self, commands=None, scorer=None, weights=None, refine=True):
+        self.lock = threading.RLock()
+        self.scorer = scorer or make_scorer()
+        self.weights = dict(self.FIELD_WEIGHTS, **(weights or {}))
+        self.refine = refine
+        self.next_id = 0
+        self.version = 0
+        self.cache = QueryCache()
+        self.clear()
+        if commands:
+            self.add_many(commands)
+
+    def __len__(self):
+        return len(self.commands)
+
+    def clear(self):
+        with self.lock:
+            self.keys = {}
+            self.commands = {}
+            self.ids_by_key = {}
+            self.fields = {field: FieldIndex(self.scorer) for field in ("name", "description", "variables")}
+            for field_index in self.fields.values():
+                field_index.refine = self.refine
+            self.ids_by_action = {}
+            self.version += 1
+            self.cache.clear()
+
+    def add(self, command):
+        with self.lock:
+            command_id = self.next_id
+            self.next_id += 1
+            self.version += 1
+            key = normalize_key(command[0])
+            self.keys[command_id] = key
+            self.commands[command_id] = command
+            self.ids_by_key.setdefault(key, []).append(command_id)
+
+            self.fields["name"].add(command_id, key)
+            self.fields["description"].add(command_id, command[1])
+            # The variable names in the target, e.g. "query" for ".../search?q={query}"; a
+            # Command has them parsed already, a plain tuple is parsed here
+            variables = getattr(command, "variables", None)
+            if variables is None:
+                variables = TargetTemplate(command[3]).variables
+            if variables:
+                self.fields["variables"].add(command_id, " ".join(variables))
+            action = utils.full_process(command[2])
+            if action:
+                self.ids_by_action.setdefault(action, set()).add(command_id)
+            return command_id
+
+    def add_many(self, commands):
+        with self.lock:
+            for command in commands:
+                self.add(command)
+
+    def find(self, command):
+        for command_id in self.ids_by_key.get(normalize_key(command[0]), []):
+            if self.commands[command_id] == command:
+                return command_id
+        return None
+
+    def remove(self, command):
+        with self.lock:
+            command_id = self.find(command)
+            if command_id is None:
+                return False
+            self.version += 1
+            key = self.keys.pop(command_id)
+            del self.commands[command_id]
+            ids = self.ids_by_key[key]
+            ids.remove(command_id)
+            if not ids:
+                del self.ids_by_key[key]
+
+            for field_index in self.fields.values():
+                field_index.remove(command_id)
+            action = utils.full_process(command[2])
+            if action in self.ids_by_action:
+                self.ids_by_action[action].discard(command_id)
+                if not self.ids_by_action[action]:
+                    del self.ids_by_action[action]
+            return True
+
+    def replace(self, old_command, new_command):
+        with self.lock:
+            self.remove(old_command)
+            return self.add(new_command)
+
+    def ids_for(self, key):
+        # Ids of the commands whose first four fields equal `key`, the identity history uses.
+        return [command_id for command_id in self.ids_by_key.get(normalize_key(key[0]), []) if self.commands[command_id][:4] == key]
+
+    def search(self, query, threshold, limit=12, boosts=None):
+        # `boosts` maps command keys (name, description, action, target) to extra ranking
+        # points, e.g. from FrecencyRanker.boosts(). They reorder matches but never let a
+        # command below `threshold` in.
+        query = normalize_key(query)
+        with self.lock:
+            if not query or not self.keys:
+                return []
+            processed_query = utils.full_process(query)
+            scores = {command_id: score for command_id, score in self.scores(processed_query, threshold, limit).items()
+                      if score >= threshold - SCORE_EPSILON}
+
+            boosted_ids = {}
+            for key, boost in (boosts or {}).items():
+                for command_id in self.ids_for(key):
+                    boosted_ids[command_id] = boost
+            if boosted_ids:
+                # A boost can lift a command past a field's top `limit`, so boosted commands
+                # are scored directly. Boosts change between searches and are never cached.
+                for command_id, score in self.score_ids(processed_query, boosted_ids, threshold).items():
+                    if score > scores.get(command_id, 0):
+                        scores[command_id] = score
+
+            ranked = sorted(scores.items(), key=lambda item: (-(item[1] + boosted_ids.get(item[0], 0)), item[0]))[:limit]
+            return [self.commands[command_id] for command_id, score in ranked]
+
+    def scores(self, processed_query, threshold, limit):
+        # Best weighted score of every command that can reach the top `limit` at `threshold`.
+        # Filtering the result by a higher threshold gives exactly what scoring at that
+        # threshold would, so the cache only rescores when the threshold goes down.
+        key = (self.version, processed_query, limit)
+        scores = self.cache.lookup(key, threshold)
+        if scores is not None:
+            return scores
+        scores = {}
+
+        def merge(command_id, score):
+            if score > scores.get(command_id, 0):
+                scores[command_id] = score
+
+        for field, field_index in self.fields.items():
+            weight = self.weights[field]
+            field_threshold = self.field_threshold(threshold, weight)
+            if field_threshold is None:
+                continue
+            for command_id, score in field_index.top(processed_query, field_threshold, limit):
+                merge(command_id, score * weight)
+
+        for action, score in self.action_scores(processed_query, threshold).items():
+            for command_id in heapq.nsmallest(limit, self.ids_by_action[action]):
+                merge(command_id, score)
+
+        self.cache.store(key, threshold, scores)
+        return scores
+
+    def score_ids(self, processed_query, command_ids, threshold):
+        scores = {}
+
+        def merge(command_id, score):
+            if score > scores.get(command_id, 0):
+                scores[command_id] = score
+
+        for field, field_index in self.fields.items():
+            weight = self.weights[field]
+            field_threshold = self.field_threshold(threshold, weight)
+            if field_threshold is None:
+                continue
+            for command_id, score in field_index.score_ids(processed_query, command_ids, field_threshold):
+                merge(command_id, score * weight)
+
+        for action, score in self.action_scores(processed_query, threshold).items():
+            matching_ids = self.ids_by_action[action]
+            for command_id in command_ids:
+                if command_id in matching_ids:
+                    merge(command_id, score)
+        return scores
+
+    def action_scores(self, processed_query, threshold):
+        # Weighted score of every distinct action type that reaches `threshold`.
+        weight = self.weights["action"]
+        field_threshold = self.field_threshold(threshold, weight)
+        if field_threshold is None or not processed_query or not self.ids_by_action:
+            return {}
+        actions = list(self.ids_by_action)
+        return {actions[index]: score * weight
+                for index, score in self.scorer.extract(processed_query, dict(enumerate(actions)), len(actions))
+                if score >= field_threshold}
+
+    def field_threshold(self, threshold, weight):
+        # Lowest rounded field score that still reaches `threshold` once weighted.
+        if weight <= 0:
+            return None
+        field_threshold = math.ceil(threshold / weight - 1e-9)
+        return field_threshold if field_threshold <= 100 else None
+
@@ -0,0 +1,83 @@
+import threading
+
+
+class SearchScheduler:
+    # Coalesces bursts of keystrokes into one search, scores it on a worker thread and hands
+    # the newest result set back to the Tk thread. Every schedule() bumps the generation, so
+    # results computed for a query the user has already typed past are dropped, never shown.
+    # Tk is not thread safe: the worker only stores its result and the Tk side polls for it
+    # with after() while a search is in flight.
+    POLL_MS = 10
+
+    def __init__(self, widget, search, deliver, debounce_ms=80):
+        self.widget = widget
+        self.search = search
+        self.deliver = deliver
+        self.debounce_ms = debounce_ms
+
+        self.generation = 0
+        self.debounce_job = None
+        self.poll_job = None
+        self.request = None
+        self.ready = None
+        self.busy = False
+        self.condition = threading.Condition()
+
+        self.worker = threading.Thread(target=self.run, name="search-worker", daemon=True)
+        self.worker.start()
+
+    def schedule(self, query):
+        self.generation += 1
+        if self.debounce_job is not None:
+            self.widget.after_cancel(self.debounce_job)
+        self.debounce_job = self.widget.after(self.debounce_ms, self.submit, self.generation, query)
+
+    def cancel(self):
+        self.generation += 1
+        if self.debounce_job is not None:
+            self.widget.after_cancel(self.debounce_job)
+            self.debounce_job = None
+        with self.condition:
+            self.request = None
+            self.ready = None
+
+    def is_pending(self):
+        with self.condition:
+            return self.debounce_job is not None or self.request is not None or self.busy
+
+    def submit(self, generation, query):
+        self.debounce_job = None
+        with self.condition:
+            self.request = (generation, query)
+            self.condition.notify()
+        if self.poll_job is None:
+            self.poll_job = self.widget.after(self.POLL_MS, self.poll)
+
+    def run(self):
+        while True:
+            with self.condition:
+                while self.request is None:
+                    self.condition.wait()
+                generation, query = self.request
+                self.request = None
+                self.busy = True
+            try:
+                results = self.search(query)
+            except Exception as e:
+                print(f"An error occurred while searching for \"{query}\": {e}")
+                results = []
+            with self.condition:
+                self.busy = False
+                if generation == self.generation:
+                    self.ready = (generation, query, results)
+
+    def poll(self):
+        self.poll_job = None
+        with self.condition:
+            ready = self.ready
+            self.ready = None
+            in_flight = self.request is not None or self.busy
+        if ready is not None and ready[0] == self.generation:
+            self.deliver(ready[1], ready[2])
+        elif in_flight:
+            self.poll_job = self.widget.after(self.POLL_MS, self.poll)
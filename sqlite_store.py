@@ -0,0 +1,290 @@
+import json
+import sqlite3
+import threading
+from collections import OrderedDict
+from collections.abc import Sequence
+from command_record import Command
+from command_store import command_from_json
+from query_cache import QueryCache
+from target_template import TargetTemplate
+
+
+def command_from_row(row):
+    # The negated rowid is the command's id, the same every time the row is read and
+    # never one of the positive ids of in-memory commands
+    row_id, name, description, action, target, origin, target_vars = row
+    return Command(name, description, action, target, origin, json.loads(target_vars) if target_vars else None, -row_id)
+
+
+class SQLiteCommandStore:
+    # Drop-in for CommandStore (command_store.py) that keeps custom commands in a SQLite
+    # database instead of JSON, for libraries too large to hold in Python lists. Every
+    # change is one small transaction, and an FTS5 trigram index over the name, the
+    # description and the target's variable names serves as the first stage of search
+    # (see FTSSearchIndex). load() returns a CommandPages view, so only the rows the UI
+    # actually reads become tuples.
+    #
+    # The connection is shared with the search worker thread, hence the lock.
+    lazy = True
+    load_error = None
+    COLUMNS = "name, description, action, target, origin, target_vars"
+    ROW_COLUMNS = "id, " + COLUMNS
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.RLock()
+        self.version = 0
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        with self.lock, self.connection:
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.executescript("""
+                CREATE TABLE IF NOT EXISTS commands (
+                    id INTEGER PRIMARY KEY,
+                    name TEXT NOT NULL UNIQUE,
+                    description TEXT NOT NULL DEFAULT '',
+                    action TEXT NOT NULL,
+                    target TEXT NOT NULL,
+                    origin TEXT NOT NULL DEFAULT 'CUSTOM',
+                    target_vars TEXT,
+                    variables TEXT NOT NULL DEFAULT ''
+                );
+            """)
+            columns = {row[1] for row in self.connection.execute("PRAGMA table_info(commands)")}
+            migrate = "variables" not in columns
+            if migrate:
+                self.add_variables_column()
+            self.connection.executescript("""
+                CREATE INDEX IF NOT EXISTS commands_action ON commands(action, id);
+                CREATE VIRTUAL TABLE IF NOT EXISTS commands_fts USING fts5(
+                    name, description, variables, content='commands', content_rowid='id', tokenize='trigram'
+                );
+                CREATE TRIGGER IF NOT EXISTS commands_ai AFTER INSERT ON commands BEGIN
+                    INSERT INTO commands_fts(rowid, name, description, variables) VALUES (new.id, new.name, new.description, new.variables);
+                END;
+                CREATE TRIGGER IF NOT EXISTS commands_ad AFTER DELETE ON commands BEGIN
+                    INSERT INTO commands_fts(commands_fts, rowid, name, description, variables) VALUES ('delete', old.id, old.name, old.description, old.variables);
+                END;
+                CREATE TRIGGER IF NOT EXISTS commands_au AFTER UPDATE ON commands BEGIN
+                    INSERT INTO commands_fts(commands_fts, rowid, name, description, variables) VALUES ('delete', old.id, old.name, old.description, old.variables);
+                    INSERT INTO commands_fts(rowid, name, description, variables) VALUES (new.id, new.name, new.description, new.variables);
+                END;
+            """)
+            if migrate:
+                self.connection.execute("INSERT INTO commands_fts(commands_fts) VALUES ('rebuild')")
+
+    def add_variables_column(self):
+        # Databases from before the variables column: the FTS table and its triggers only
+        # covered name and description, so they are rebuilt after the column is filled in
+        self.connection.executescript("""
+            DROP TRIGGER IF EXISTS commands_ai;
+            DROP TRIGGER IF EXISTS commands_ad;
+            DROP TRIGGER IF EXISTS commands_au;
+            DROP TABLE IF EXISTS commands_fts;
+            ALTER TABLE commands ADD COLUMN variables TEXT NOT NULL DEFAULT '';
+        """)
+        rows = self.connection.execute("SELECT id, target FROM commands WHERE target LIKE '%{%'").fetchall()
+        self.connection.executemany(
+            "UPDATE commands SET variables = ? WHERE id = ?",
+            [(" ".join(TargetTemplate(target).variables), row_id) for row_id, target in rows],
+        )
+
+    def load(self):
+        return CommandPages(self)
+
+    def row_values(self, command):
+        command = command_from_json(command)
+        return command[0], command[1], command[2], command[3], command[4], json.dumps(command[5]), " ".join(command.variables)
+
+    def add(self, command):
+        self.add_many([command])
+
+    def add_many(self, commands):
+        with self.lock, self.connection:
+            self.connection.executemany(
+                # An upsert rather than INSERT OR REPLACE, so an overwritten command keeps its row id
+                f"INSERT INTO commands ({self.COLUMNS}, variables) VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT(name) DO UPDATE SET "
+                "description = excluded.description, action = excluded.action, target = excluded.target, "
+                "origin = excluded.origin, target_vars = excluded.target_vars, variables = excluded.variables",
+                [self.row_values(command) for command in commands],
+            )
+            self.version += 1
+
+    def edit(self, old_command, new_command):
+        with self.lock, self.connection:
+            self.connection.execute(
+                "UPDATE commands SET name = ?, description = ?, action = ?, target = ?, origin = ?, target_vars = ?, variables = ? "
+                "WHERE name = ?",
+                self.row_values(new_command) + (old_command[0],),
+            )
+            self.version += 1
+
+    def delete(self, command):
+        with self.lock, self.connection:
+            self.connection.execute("DELETE FROM commands WHERE name = ?", (command[0],))
+            self.version += 1
+
+    def find(self, name):
+        with self.lock:
+            row = self.connection.execute(f"SELECT {self.ROW_COLUMNS} FROM commands WHERE name = ?", (name,)).fetchone()
+        return command_from_row(row) if row else None
+
+    def names(self):
+        with self.lock:
+            return {name for name, in self.connection.execute("SELECT name FROM commands")}
+
+    def count(self):
+        with self.lock:
+            return self.connection.execute("SELECT COUNT(*) FROM commands").fetchone()[0]
+
+    def page(self, offset, count):
+        with self.lock:
+            rows = self.connection.execute(f"SELECT {self.ROW_COLUMNS} FROM commands ORDER BY id LIMIT ? OFFSET ?", (count, offset)).fetchall()
+        return [command_from_row(row) for row in rows]
+
+    def candidates(self, query, limit, per_action=0):
+        # First-stage matches for `query` in catalog order: the first `limit` rows containing
+        # it and the `limit` sharing the most trigrams with it by FTS5's bm25, or for queries
+        # too short to have trigrams, the first rows containing them. Also the first
+        # `per_action` rows of every action type, which is where SearchIndex takes an action
+        # match's commands from. search_index is imported here and in FTSSearchIndex so
+        # opening the store at startup does not pull in the fuzzy matching libraries.
+        from thefuzz import utils
+        from search_index import GRAM_SIZE, key_grams
+        processed = utils.full_process(query)
+        if not processed:
+            return []
+        with self.lock:
+            if len(processed) >= GRAM_SIZE:
+                # Rows containing the whole query score 100 and rank by catalog order, so the
+                # earliest of them go first; then the best partial matches.
+                match = " OR ".join(f'"{gram}"' for gram in sorted(key_grams(processed)))
+                rows = self.connection.execute(
+                    f"SELECT {self.ROW_COLUMNS} FROM commands WHERE id IN "
+                    "(SELECT rowid FROM commands_fts WHERE commands_fts MATCH ? ORDER BY rowid LIMIT ?) "
+                    "OR id IN (SELECT rowid FROM commands_fts WHERE commands_fts MATCH ? ORDER BY rank LIMIT ?) ORDER BY id",
+                    (f'"{processed}"', limit, match, limit),
+                ).fetchall()
+            else:
+                pattern = f"%{processed}%"
+                rows = self.connection.execute(
+                    f"SELECT {self.ROW_COLUMNS} FROM commands WHERE name LIKE ? OR description LIKE ? OR variables LIKE ? "
+                    "ORDER BY id LIMIT ?",
+                    (pattern, pattern, pattern, limit),
+                ).fetchall()
+            if per_action:
+                for action, in self.connection.execute("SELECT DISTINCT action FROM commands").fetchall():
+                    rows += self.connection.execute(
+                        f"SELECT {self.ROW_COLUMNS} FROM commands WHERE action = ? ORDER BY id LIMIT ?", (action, per_action)
+                    ).fetchall()
+        rows = sorted({row[0]: row for row in rows}.values())
+        return [command_from_row(row) for row in rows]
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+
+class CommandPages(Sequence):
+    # Read-only, list-like view of the stored commands in insertion order. Rows are fetched
+    # a page at a time and only the last few pages are kept.
+    PAGE_SIZE = 64
+    CACHED_PAGES = 16
+
+    def __init__(self, store):
+        self.store = store
+        self.pages = OrderedDict()
+        self.version = None
+        self.length = 0
+
+    def sync(self):
+        if self.version != self.store.version:
+            self.pages.clear()
+            self.length = self.store.count()
+            self.version = self.store.version
+
+    def __len__(self):
+        self.sync()
+        return self.length
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        self.sync()
+        if index < 0:
+            index += self.length
+        if not 0 <= index < self.length:
+            raise IndexError("command index out of range")
+        number = index // self.PAGE_SIZE
+        page = self.pages.get(number)
+        if page is None:
+            page = self.pages[number] = self.store.page(number * self.PAGE_SIZE, self.PAGE_SIZE)
+            while len(self.pages) > self.CACHED_PAGES:
+                self.pages.popitem(last=False)
+        else:
+            self.pages.move_to_end(number)
+        return page[index % self.PAGE_SIZE]
+
+    def __iter__(self):
+        for offset in range(0, len(self), self.PAGE_SIZE):
+            yield from self.store.page(offset, self.PAGE_SIZE)
+
+
+class FTSSearchIndex:
+    # SearchIndex front end for a SQLite catalog. The in-memory index only holds the
+    # built-in commands; each query pulls its FTS5 candidates from the store and ranks
+    # them together with the built-ins as SearchIndex would rank that set. The first stage
+    # is an approximation: a command that contains no run of the query and is past the
+    # CANDIDATES best by bm25 is not seen, even if partial_ratio would have ranked it.
+    #
+    # The SearchIndex built for a query is cached, per query and limit, until the catalog
+    # changes, so retyping or deleting back to a query reuses it and its own score cache.
+    CANDIDATES = 500
+    CACHED_INDEXES = 16
+
+    def __init__(self, store, scorer=None, weights=None):
+        from search_index import SearchIndex
+        self.store = store
+        self.builtins = SearchIndex(scorer=scorer, weights=weights)
+        self.scorer = self.builtins.scorer
+        self.weights = self.builtins.weights
+        self.lock = self.builtins.lock
+        self.cache = QueryCache(self.CACHED_INDEXES)
+
+    def __len__(self):
+        return len(self.builtins) + self.store.count()
+
+    @property
+    def version(self):
+        return (self.builtins.version, self.store.version)
+
+    def clear(self):
+        self.builtins.clear()
+        self.cache.clear()
+
+    def add(self, command):
+        return self.builtins.add(command)
+
+    def add_many(self, commands):
+        self.builtins.add_many(commands)
+
+    def remove(self, command):
+        return self.builtins.remove(command)
+
+    def replace(self, old_command, new_command):
+        return self.builtins.replace(old_command, new_command)
+
+    def search(self, query, threshold, limit=12, boosts=None):
+        from thefuzz import utils
+        from search_index import SearchIndex
+        processed_query = utils.full_process(query.lower())
+        if not processed_query:
+            return []
+        key = (self.version, processed_query, limit)
+        with self.lock:
+            index = self.cache.lookup(key, 0)
+            if index is None:
+                index = SearchIndex(scorer=self.scorer, weights=self.weights, refine=False)
+                index.add_many(self.builtins.commands.values())
+                index.add_many(self.store.candidates(processed_query, self.CANDIDATES, limit))
+                self.cache.store(key, 0, index)
+        return index.search(query, threshold, limit, boosts)
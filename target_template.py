@@ -0,0 +1,56 @@
+import string
+
+_formatter = string.Formatter()
+
+
+class TargetTemplate:
+    # A command target such as "https://www.google.com/search?q={query}", parsed once. It
+    # keeps the literal text between the variables, the variables in order of first use,
+    # and `error`, which says why the target is malformed (an unmatched brace, a
+    # positional "{}" or "{0}", an attribute or index like "{a.b}") or is None. Rendering
+    # follows str.format: "{{" and "}}" are literal braces, and "!r" conversions and
+    # ":>8" format specs work as they would there.
+    __slots__ = ("target", "segments", "variables", "error")
+
+    def __init__(self, target):
+        self.target = target
+        self.segments = []
+        self.variables = []
+        self.error = None
+        try:
+            for literal, field, spec, conversion in _formatter.parse(target):
+                if field is None:
+                    self.segments.append((literal, None, None, None))
+                    continue
+                if not field.isidentifier():
+                    if not field or field.isdigit():
+                        raise ValueError("variables need a name, e.g. {query}")
+                    raise ValueError(f"{{{field}}} is not a valid variable name")
+                if "{" in spec:
+                    raise ValueError(f"nested braces in the format of {{{field}}}")
+                self.segments.append((literal, field, spec, conversion))
+                if field not in self.variables:
+                    self.variables.append(field)
+        except ValueError as e:
+            self.segments, self.variables, self.error = [], [], str(e)
+
+    @property
+    def valid(self):
+        return self.error is None
+
+    def render(self, values):
+        # Raises KeyError for a variable without a value, as str.format did. A malformed
+        # target is returned as it is, braces and all
+        if self.error is not None:
+            return self.target
+        parts = []
+        for literal, field, spec, conversion in self.segments:
+            parts.append(literal)
+            if field is None:
+                continue
+            value = values[field]
+            if conversion:
+                value = _formatter.convert_field(value, conversion)
+            parts.append(format(value, spec) if spec else str(value))
+        return "".join(parts)
+
@@ -0,0 +1,67 @@
+import random
+from command_record import Command, CommandRegistry
+from command_store import CommandsWithout
+from palette_core import PaletteCore
+
+
+def command(name, command_id=None):
+    return Command(name, f"about {name}", "WEB", f"https://example.com/{name}", command_id=command_id)
+
+
+def assert_positions(registry):
+    ordered = registry.ordered()
+    assert len(ordered) == len(registry)
+    assert all(registry.position(cmd.id) == index for index, cmd in enumerate(ordered))
+
+
+def test_registry_keeps_order_and_positions_through_changes():
+    rng = random.Random(0)
+    commands = [command(f"c{i}") for i in range(200)]
+    registry = CommandRegistry(commands)
+    expected = list(commands)
+    for step in range(300):
+        victim = rng.choice(expected)
+        if step % 3 == 0:
+            registry.remove(victim)
+            expected.remove(victim)
+        elif step % 3 == 1:
+            edited = command(victim.name + "e", victim.id)
+            registry.replace(victim, edited)
+            expected[expected.index(victim)] = edited
+        else:
+            added = command(f"n{step}")
+            registry.add(added)
+            expected.append(added)
+        assert_positions(registry)
+    assert [cmd.id for cmd in registry.ordered()] == [cmd.id for cmd in expected]
+    assert registry.find(expected[-1].name) is expected[-1]
+
+
+def test_commands_without_skips_positions():
+    items = list(range(20))
+    for skipped in ([], [0], [19], [3, 4, 5], [0, 7, 19, 7]):
+        view = CommandsWithout(items, skipped)
+        expected = [item for item in items if item not in skipped]
+        assert len(view) == len(expected)
+        assert list(view) == expected
+        assert [view[i] for i in range(len(view))] == expected
+        assert view[-1] == expected[-1]
+        assert view[2:5] == expected[2:5]
+
+
+def test_listing_matches_history_then_the_rest(tmp_path):
+    builtins = [(f"builtin {i}", "built in", "WEB", f"https://example.com/b{i}") for i in range(5)]
+    core = PaletteCore(builtins, commands_file=str(tmp_path / "custom_commands.json"), history_file=str(tmp_path / "history.json"))
+    core.load_history()
+    core.wait_for_catalog()
+    core.add_commands([command(f"c{i}") for i in range(50)])
+    for name in ("c3", "builtin 1", "c49", "c3"):
+        core.record_launch(core.find_command(name))
+    core.remove_command(core.find_command("c10"))
+
+    history_ids = {cmd.id for cmd in core.command_history}
+    expected = core.command_history + [cmd for cmd in core.commands if cmd.id not in history_ids]
+    listing = core.listing()
+    assert [cmd.id for cmd in listing] == [cmd.id for cmd in expected]
+    assert [listing[i].id for i in range(len(listing))] == [cmd.id for cmd in expected]
+    core.close()
@@ -0,0 +1,75 @@
+import glob
+import json
+import os
+from command_record import Command
+from command_store import CommandStore
+
+
+def command(name):
+    return Command(name, f"about {name}", "WEB", f"https://example.com/{name}")
+
+
+def write_snapshot(path, names, sequence=0):
+    with open(path, "w") as f:
+        json.dump({"sequence": sequence, "commands": [list(command(name)) for name in names]}, f)
+
+
+def test_journal_and_compaction_keep_every_change(tmp_path):
+    path = str(tmp_path / "custom_commands.json")
+    write_snapshot(path, ["a", "b"])
+    store = CommandStore(path)
+    assert [cmd.name for cmd in store.load()] == ["a", "b"]
+    store.add_many([command(f"n{i}") for i in range(CommandStore.COMPACT_MIN_RECORDS)])
+    store.delete(command("a"))
+    store.edit(command("b"), command("b2"))
+    store.close()
+
+    reloaded = CommandStore(path)
+    names = [cmd.name for cmd in reloaded.load()]
+    reloaded.close()
+    assert len(names) == CommandStore.COMPACT_MIN_RECORDS + 1
+    assert "a" not in names and "b2" in names and "b" not in names
+
+
+def test_unreadable_snapshot_is_moved_aside_not_overwritten(tmp_path):
+    path = str(tmp_path / "custom_commands.json")
+    with open(path, "w") as f:
+        f.write('{"sequence": 0, "commands": [["a", "about a", "WEB", "https://example.com/a"],]}')
+    with open(path) as f:
+        original = f.read()
+
+    store = CommandStore(path)
+    assert store.load() == []
+    assert store.load_error is not None
+    for i in range(CommandStore.COMPACT_MIN_RECORDS + 10):
+        store.add(command(f"n{i}"))
+    store.close()
+
+    corrupt = glob.glob(path + ".corrupt-*")
+    assert len(corrupt) == 1
+    with open(corrupt[0]) as f:
+        assert f.read() == original
+    assert corrupt[0] in store.load_error
+
+
+def test_store_goes_read_only_when_the_snapshot_cannot_be_moved(tmp_path, monkeypatch):
+    path = str(tmp_path / "custom_commands.json")
+    with open(path, "w") as f:
+        f.write("[not json")
+
+    def refuse(source, destination):
+        raise PermissionError("read-only directory")
+
+    monkeypatch.setattr(os, "replace", refuse)
+    store = CommandStore(path)
+    store.load()
+    assert store.read_only
+    for i in range(CommandStore.COMPACT_MIN_RECORDS + 10):
+        store.add(command(f"n{i}"))
+    store.close()
+    monkeypatch.undo()
+
+    with open(path) as f:
+        assert f.read() == "[not json"
+    assert not os.path.exists(store.journal_path)
+    assert [cmd.name for cmd in store.commands.values()][:2] == ["n0", "n1"]
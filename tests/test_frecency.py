@@ -0,0 +1,78 @@
+import os
+from command_record import Command
+from frecency import FrecencyRanker
+from palette_core import PaletteCore
+
+NOW = 1_000_000.0
+
+
+def command(name, target="https://example.com", target_vars=None):
+    return Command(name, f"about {name}", "WEB", target, "HISTORY", target_vars)
+
+
+def ranker_with(*launches):
+    ranker = FrecencyRanker(epoch=NOW)
+    for cmd, when in launches:
+        ranker.record(cmd.key, cmd, when)
+    return ranker
+
+
+def test_more_and_newer_launches_rank_first():
+    a, b, c = command("a"), command("b"), command("c")
+    ranker = ranker_with((a, NOW), (b, NOW), (b, NOW + 1), (c, NOW + 14 * 86400))
+    assert ranker.top_commands(3) == [c, b, a]
+    assert ranker.entries[b.key][0] == 2
+
+
+def test_forget_drops_the_command():
+    a, b = command("a"), command("b")
+    ranker = ranker_with((a, NOW), (a, NOW), (b, NOW))
+    ranker.forget(a.key)
+    assert ranker.top_commands(5) == [b]
+
+
+def test_rename_to_a_new_key_keeps_the_score():
+    a, b = command("a"), command("b")
+    ranker = ranker_with((a, NOW), (a, NOW), (b, NOW))
+    renamed = command("a2")
+    ranker.rename(a.key, renamed.key, renamed)
+    assert ranker.top_commands(5) == [renamed, b]
+    assert a.key not in ranker.entries
+
+
+def test_rename_to_the_same_key_lists_the_command_once():
+    a, b = command("a"), command("b")
+    ranker = ranker_with((a, NOW), (a, NOW), (b, NOW))
+    edited = Command(a.name, a.description, a.action, a.target, "HISTORY", {"query": "x"}, a.id)
+    for _ in range(3):
+        ranker.rename(a.key, edited.key, edited)
+    top = ranker.top_commands(5)
+    assert top == [edited, b]
+    assert top[0].target_vars == {"query": "x"}
+
+
+def test_round_trip_keeps_the_order():
+    a, b = command("a"), command("b")
+    ranker = ranker_with((a, NOW), (b, NOW), (b, NOW))
+    restored = FrecencyRanker.from_dict(ranker.to_dict())
+    assert [cmd.key for cmd in restored.top_commands(5)] == [b.key, a.key]
+
+
+def test_editing_only_the_variables_keeps_one_history_entry(tmp_path):
+    core = PaletteCore([], commands_file=str(tmp_path / "custom_commands.json"), history_file=str(tmp_path / "history.json"))
+    core.load_history()
+    core.wait_for_catalog()
+    google = Command("google", "web search", "WEB", "https://google.com/search?q={query}", "CUSTOM", {"query": "a"})
+    other = Command("other", "something else", "WEB", "https://example.com")
+    core.add_commands([google, other])
+    core.record_launch(google)
+    core.record_launch(google)
+    core.record_launch(other)
+
+    edited = Command(google.name, google.description, google.action, google.target, "CUSTOM", {"query": "b"}, google.id)
+    core.replace_command(google, edited)
+    core.carry_over_launches(google, edited)
+    assert [cmd.name for cmd in core.command_history] == ["google", "other"]
+    assert core.command_history[0].target_vars == {"query": "b"}
+    core.close()
+    assert os.path.exists(tmp_path / "history.ndjson")
@@ -0,0 +1,64 @@
+import os
+from command_record import Command
+from history_log import HistoryLog
+
+NOW = 1_000_000.0
+
+
+def command(name):
+    return Command(name, f"about {name}", "WEB", f"https://example.com/{name}", "HISTORY")
+
+
+def names(ranker, count=10):
+    return [cmd.name for cmd in ranker.top_commands(count)]
+
+
+def reopen(path):
+    return HistoryLog(path).load()
+
+
+def test_launches_survive_a_reload(tmp_path):
+    path = str(tmp_path / "history.json")
+    log = HistoryLog(path)
+    log.load()
+    a, b = command("a"), command("b")
+    log.record(a, NOW)
+    log.record(b, NOW)
+    log.record(b, NOW + 1)
+    log.flush()
+    assert os.path.exists(log.log_path)
+    assert not os.path.exists(path)
+    assert names(reopen(path)) == ["b", "a"]
+
+
+def test_compaction_writes_a_snapshot_and_starts_a_new_log(tmp_path):
+    path = str(tmp_path / "history.json")
+    log = HistoryLog(path)
+    log.COMPACT_RECORDS = 10
+    log.load()
+    commands = [command(f"c{i}") for i in range(5)]
+    for i in range(25):
+        log.record(commands[i % 5], NOW + i)
+    log.flush()
+    assert os.path.exists(path)
+    with open(log.log_path) as f:
+        assert len(f.readlines()) < 10
+    # The last launch wins the tie on count
+    assert names(reopen(path)) == ["c4", "c3", "c2", "c1", "c0"]
+
+
+def test_forget_and_rename_are_replayed(tmp_path):
+    path = str(tmp_path / "history.json")
+    log = HistoryLog(path)
+    log.load()
+    a, b, c = command("a"), command("b"), command("c")
+    for cmd in (a, a, a, b, b, c):
+        log.record(cmd, NOW)
+    renamed = command("a2")
+    log.rename(a.key, renamed)
+    log.forget(b.key)
+    assert names(log.ranker) == ["a2", "c"]
+    log.flush()
+    ranker = reopen(path)
+    assert names(ranker) == ["a2", "c"]
+    assert a.key not in ranker.entries and b.key not in ranker.entries
@@ -0,0 +1,42 @@
+import random
+import pytest
+from thefuzz import utils
+import scorers
+
+pytest.importorskip("rapidfuzz")
+
+WORDS = ["open", "google", "youtube", "shutdown", "restart", "calc", "notes", "mail", "spotify", "github",
+         "docs", "drive", "terminal", "settings", "music", "photo", "video", "search", "weather", "deploy"]
+QUERIES = ["y", "yout", "youtube", "shutdown pc", "gith", "open goo", "wether", "calc 12", "zzz", "o", "music 7"]
+
+
+@pytest.fixture(scope="module")
+def catalog():
+    rng = random.Random(0)
+    return {i: utils.full_process(" ".join(rng.sample(WORDS, rng.randint(1, 3))) + f" {i}") for i in range(5000)}
+
+
+@pytest.mark.parametrize("threshold", [1, 40, 60, 85, 100])
+def test_rapidfuzz_matches_thefuzz(catalog, threshold):
+    assert scorers.compare_backends(QUERIES, catalog, threshold, backends=[scorers.RapidFuzzScorer()]) == []
+
+
+@pytest.mark.parametrize("threshold", [1, 60, 90])
+def test_rapidfuzz_without_numpy_matches_thefuzz(catalog, threshold, monkeypatch):
+    monkeypatch.setattr(scorers, "numpy", None)
+    assert scorers.compare_backends(QUERIES, catalog, threshold, backends=[scorers.RapidFuzzScorer()]) == []
+
+
+@pytest.mark.parametrize("limit", [1, 12, 100])
+def test_extract_all_agrees_with_extract(catalog, limit):
+    for scorer in (scorers.TheFuzzScorer(), scorers.RapidFuzzScorer()):
+        for query in QUERIES:
+            ranked, all_scores = scorer.extract_all(query, catalog, limit)
+            assert ranked == scorer.extract(query, catalog, limit)
+            assert len(all_scores) == len(catalog)
+            assert all(all_scores[command_id] == score for command_id, score in ranked)
+
+
+def test_empty_catalog():
+    for scorer in (scorers.TheFuzzScorer(), scorers.RapidFuzzScorer()):
+        assert scorer.extract("youtube", {}, 12) == []
@@ -0,0 +1,90 @@
+import random
+import pytest
+from thefuzz import utils
+import search_index
+from search_index import FieldIndex, SearchIndex
+from scorers import make_scorer
+
+WORDS = ["open", "google", "youtube", "shutdown", "restart", "calc", "notes", "mail", "spotify", "github",
+         "docs", "drive", "terminal", "settings", "music", "photo", "video", "search", "weather", "deploy",
+         "banana", "aaa", "mississippi", "go", "pc"]
+TRACES = ["youtube music", "github deploy", "open settings", "shutdown pc", "wether today", "mississipi", "aaaa", "zzz"]
+THRESHOLDS = [40, 60, 85]
+
+
+def typo(word, rng):
+    if len(word) < 3 or rng.random() < 0.6:
+        return word
+    i = rng.randrange(len(word) - 1)
+    kind = rng.randrange(3)
+    if kind == 0:
+        return word[:i] + word[i + 1] + word[i] + word[i + 2:]
+    if kind == 1:
+        return word[:i] + word[i + 1:]
+    return word[:i] + word[i] + word[i:]
+
+
+def make_catalog(size=6000, seed=0):
+    rng = random.Random(seed)
+    catalog = []
+    for i in range(size):
+        name = " ".join(typo(word, rng) for word in rng.sample(WORDS, rng.randint(1, 3)))
+        if rng.random() < 0.7:
+            name += f" {i}"
+        description = " ".join(typo(word, rng) for word in rng.sample(WORDS, 3))
+        target = "https://example.com/{query}" if i % 5 == 0 else "https://example.com"
+        catalog.append((name, description, "WEB", target, "CUSTOM", {}))
+    return catalog
+
+
+def prefixes():
+    return [trace[:end] for trace in TRACES for end in range(1, len(trace) + 1)]
+
+
+@pytest.fixture(scope="module")
+def catalog():
+    return make_catalog()
+
+
+@pytest.fixture(scope="module")
+def scorer():
+    return make_scorer()
+
+
+def full_scan_top(field_index, processed_query, threshold, limit):
+    return field_index.extract(processed_query, field_index.processed, threshold, limit)
+
+
+@pytest.mark.parametrize("limit", [1, 12])
+@pytest.mark.parametrize("threshold", THRESHOLDS)
+def test_field_index_pruning_and_refinement_match_full_scan(catalog, scorer, threshold, limit):
+    field_index = FieldIndex(scorer)
+    for command_id, command in enumerate(catalog):
+        field_index.add(command_id, command[0].lower())
+    assert len(field_index) >= search_index.PRUNE_MIN_COMMANDS
+    for query in prefixes():
+        processed_query = utils.full_process(query)
+        assert field_index.top(processed_query, threshold, limit) == full_scan_top(field_index, processed_query, threshold, limit), query
+
+
+@pytest.mark.parametrize("threshold", THRESHOLDS)
+def test_search_matches_full_scan(catalog, scorer, threshold, monkeypatch):
+    pruned = SearchIndex(catalog, scorer=scorer, refine=False)
+    refined = SearchIndex(catalog, scorer=scorer, refine=True)
+    for index in (pruned, refined):
+        index.cache.capacity = 0
+    expected = []
+    with monkeypatch.context() as patch:
+        patch.setattr(search_index, "PRUNE_MIN_COMMANDS", len(catalog) + 1)
+        full = SearchIndex(catalog, scorer=scorer, refine=False)
+        full.cache.capacity = 0
+        for query in prefixes():
+            expected.append(full.search(query, threshold))
+    for query, full_results in zip(prefixes(), expected):
+        assert pruned.search(query, threshold) == full_results, query
+        assert refined.search(query, threshold) == full_results, query
+
+
+def test_variables_field_uses_target_template(scorer):
+    index = SearchIndex([("Maps", "find places", "WEB", "https://maps.example.com/{place}", "CUSTOM", {})], scorer=scorer)
+    assert [command[0] for command in index.search("place", 60)] == ["Maps"]
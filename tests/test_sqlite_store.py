@@ -0,0 +1,107 @@
+import random
+import sqlite3
+import pytest
+from command_record import Command
+from scorers import make_scorer
+from search_index import SearchIndex
+from sqlite_store import FTSSearchIndex, SQLiteCommandStore
+
+WORDS = ["open", "google", "youtube", "deploy", "staging", "weather", "music", "notes", "github", "docker"]
+TARGETS = ["https://example.com/{query}", "echo {env} {branch}", "/usr/bin/{app}", "https://example.com", "echo done"]
+ACTIONS = ["WEB", "SYSTEM", "OPEN"]
+QUERIES = ["env", "branch", "query", "app", "system", "open", "web", "deploy stag", "youtub", "gi", "zzz"]
+
+
+def make_catalog(size=300, seed=0):
+    rng = random.Random(seed)
+    return [Command(" ".join(rng.sample(WORDS, rng.randint(1, 2))) + f" {i}", " ".join(rng.sample(WORDS, 3)),
+                    rng.choice(ACTIONS), rng.choice(TARGETS)) for i in range(size)]
+
+
+BUILTINS = [Command("Open YouTube", "Open youtube", "WEB", "https://youtube.com", "BUILT-IN"),
+            Command("Shutdown PC", "Turn the computer off", "SYSTEM", "shutdown now", "BUILT-IN")]
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = SQLiteCommandStore(str(tmp_path / "commands.db"))
+    yield store
+    store.close()
+
+
+def fts_index(store, scorer):
+    index = FTSSearchIndex(store, scorer=scorer)
+    index.add_many(BUILTINS)
+    return index
+
+
+@pytest.mark.parametrize("threshold", [85, 100])
+def test_close_matches_rank_like_search_index(store, threshold):
+    # A match this close shares trigrams with the query, so FTS5 hands it to the second
+    # stage whenever the catalog is smaller than CANDIDATES
+    scorer = make_scorer()
+    catalog = make_catalog()
+    store.add_many(catalog)
+    fts = fts_index(store, scorer)
+    memory = SearchIndex(BUILTINS + catalog, scorer=scorer)
+    for query in QUERIES:
+        assert [command.key for command in fts.search(query, threshold)] == [command.key for command in memory.search(query, threshold)], query
+
+
+def test_variable_names_are_searchable(store):
+    store.add_many([Command("Deploy", "ship it", "SYSTEM", "deploy --env {env}"), Command("Other", "nothing", "WEB", "https://example.com")])
+    fts = fts_index(store, make_scorer())
+    assert [command.name for command in fts.search("env", 70)] == ["Deploy"]
+    store.edit(Command("Deploy", "", "", ""), Command("Deploy", "ship it", "SYSTEM", "deploy --target {target}"))
+    assert fts.search("env", 70) == []
+    assert [command.name for command in fts.search("target", 70)] == ["Deploy"]
+
+
+def test_action_types_are_searchable(store):
+    scorer = make_scorer()
+    catalog = [Command(f"item {i}", "", ACTIONS[i % 3], "echo") for i in range(100)]
+    store.add_many(catalog)
+    fts = fts_index(store, scorer)
+    memory = SearchIndex(BUILTINS + catalog, scorer=scorer)
+    for query in ("system", "open", "web"):
+        expected = [command.key for command in memory.search(query, 60)]
+        assert expected
+        assert [command.key for command in fts.search(query, 60)] == expected
+
+
+def test_index_per_query_is_reused_until_the_catalog_changes(store):
+    store.add_many(make_catalog(50))
+    fts = fts_index(store, make_scorer())
+    first = fts.search("deploy", 60)
+    hits = fts.cache.hits
+    assert fts.search("deploy", 60) == first
+    assert fts.cache.hits == hits + 1
+    store.add(Command("deploy everything", "", "SYSTEM", "echo"))
+    assert "deploy everything" in [command.name for command in fts.search("deploy", 60)]
+
+
+def test_databases_without_the_variables_column_are_migrated(tmp_path):
+    path = str(tmp_path / "old.db")
+    connection = sqlite3.connect(path)
+    connection.executescript("""
+        CREATE TABLE commands (
+            id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE, description TEXT NOT NULL DEFAULT '',
+            action TEXT NOT NULL, target TEXT NOT NULL, origin TEXT NOT NULL DEFAULT 'CUSTOM', target_vars TEXT
+        );
+        CREATE VIRTUAL TABLE commands_fts USING fts5(name, description, content='commands', content_rowid='id', tokenize='trigram');
+        CREATE TRIGGER commands_ai AFTER INSERT ON commands BEGIN
+            INSERT INTO commands_fts(rowid, name, description) VALUES (new.id, new.name, new.description);
+        END;
+        INSERT INTO commands (name, description, action, target) VALUES ('Deploy', 'ship it', 'SYSTEM', 'deploy --env {env}');
+        INSERT INTO commands (name, description, action, target) VALUES ('Weather', 'forecast', 'WEB', 'https://example.com');
+    """)
+    connection.commit()
+    connection.close()
+
+    store = SQLiteCommandStore(path)
+    fts = fts_index(store, make_scorer())
+    assert [command.name for command in fts.search("env", 70)] == ["Deploy"]
+    assert [command.name for command in fts.search("forecast", 70)] == ["Weather"]
+    store.delete(Command("Weather", "", "", ""))
+    assert fts.search("forecast", 70) == []
+    store.close()